@@ -136,7 +136,7 @@ class AlgoliaScraper:
         nutritional_info = hit.get("nutritionalInformation", {}) or {}
 
         upc_string = hit.get("upc")
-        upc_list = upc_string.split(',') if upc_string else []
+        upc_list = [u.strip() for u in upc_string.split(',') if u.strip()] if upc_string else []
 
         return {
             "productName": hit.get("name"),
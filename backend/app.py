@@ -1,12 +1,39 @@
+import asyncio
+import base64
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import logging
+import math
+import multiprocessing
 import os
-from typing import Any, Dict, Optional, List
+import re
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, List, Set, Tuple
 
-from fastapi import FastAPI, HTTPException
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import FastAPI, File, Header, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.encoders import jsonable_encoder
-from pymongo import MongoClient
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+import pymongo
+from pymongo import MongoClient, monitoring
 from pymongo.collection import Collection
-from pymongo.errors import ConfigurationError
+from pymongo.errors import ConfigurationError, ConnectionFailure, PyMongoError
 
 try:
     from dotenv import load_dotenv  # type: ignore
@@ -14,9 +41,170 @@ try:
 except Exception:
     pass
 
+logger = logging.getLogger("wellaware.api")
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None  # type: ignore
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None  # type: ignore
+
+# Key normalization and snapshot formats shared with load_data.py, so ingest and lookup agree
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from catalog_format import (  # noqa: E402
+    BloomFilter,
+    ProductSnapshotFile,
+    canonical_gtin14,
+    canonical_scraped_at,
+    normalize_ingredient_token,
+    parse_timestamp,
+)
+
+try:
+    import cbor2  # type: ignore
+except ImportError:
+    cbor2 = None  # type: ignore
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient  # type: ignore
+except ImportError:
+    AsyncIOMotorClient = None  # type: ignore
+
+try:
+    import pytesseract  # type: ignore
+    from PIL import Image, ImageOps, UnidentifiedImageError  # type: ignore
+except ImportError:
+    pytesseract = None  # type: ignore
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOCUMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Labelled cumulative histogram rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            # Per series: one count per bucket, then +Inf count, then sum
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {int(count)}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {int(series[-2])}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {int(series[-2])}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "wellaware_http_request_duration_seconds",
+    "HTTP request latency by route template, method and status.",
+    ("route", "method", "status"),
+    LATENCY_BUCKETS,
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "wellaware_mongo_command_duration_seconds",
+    "MongoDB command latency by command name, collection and outcome.",
+    ("command", "collection", "outcome"),
+    LATENCY_BUCKETS,
+)
+MONGO_DOCUMENTS_RETURNED = Histogram(
+    "wellaware_mongo_documents_returned",
+    "Documents returned per find/aggregate/getMore batch.",
+    ("command", "collection"),
+    DOCUMENT_BUCKETS,
+)
+MONGO_TIMED_COMMANDS = {"find", "aggregate", "getMore", "count", "distinct"}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records duration and returned document counts for read commands."""
+
+    def __init__(self) -> None:
+        self._collections: Dict[Tuple[Any, int], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in MONGO_TIMED_COMMANDS:
+            return
+        value = event.command.get(event.command_name)
+        collection = value if isinstance(value, str) else str(event.command.get("collection", ""))
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _collection(self, event: Any) -> str:
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        if event.command_name not in MONGO_TIMED_COMMANDS:
+            return
+        collection = self._collection(event)
+        MONGO_COMMAND_LATENCY.observe((event.command_name, collection, "ok"), event.duration_micros / 1e6)
+        cursor = event.reply.get("cursor") if isinstance(event.reply, dict) else None
+        if isinstance(cursor, dict):
+            batch = cursor.get("firstBatch", cursor.get("nextBatch")) or []
+            MONGO_DOCUMENTS_RETURNED.observe((event.command_name, collection), len(batch))
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        if event.command_name not in MONGO_TIMED_COMMANDS:
+            return
+        collection = self._collection(event)
+        MONGO_COMMAND_LATENCY.observe((event.command_name, collection, "error"), event.duration_micros / 1e6)
+
+
+MONGO_COMMAND_METRICS = MongoCommandMetrics()
+
 
 def get_mongo_client(connection_uri: str) -> MongoClient:
-    return MongoClient(connection_uri, serverSelectionTimeoutMS=10000)
+    return MongoClient(connection_uri, serverSelectionTimeoutMS=10000, event_listeners=[MONGO_COMMAND_METRICS])
+
+
+def parse_mongo_driver() -> str:
+    driver = os.environ.get("MONGO_DRIVER", "sync").strip().lower() or "sync"
+    if driver not in ("sync", "async"):
+        raise RuntimeError("MONGO_DRIVER must be 'sync' or 'async'")
+    return driver
+
+
+def get_async_mongo_client(connection_uri: str) -> Any:
+    if AsyncIOMotorClient is None:
+        raise RuntimeError("MONGO_DRIVER=async requires the 'motor' package")
+    return AsyncIOMotorClient(
+        connection_uri, serverSelectionTimeoutMS=10000, event_listeners=[MONGO_COMMAND_METRICS]
+    )
 
 
 def get_database(client: MongoClient, desired_db_name: Optional[str]) -> Any:
@@ -31,12 +219,20 @@ def get_database(client: MongoClient, desired_db_name: Optional[str]) -> Any:
     return client["wellaware"]
 
 
-def ensure_indexes(collection: Collection) -> None:
-    collection.create_index("details.upc", name="idx_details_upc")
-    collection.create_index(
-        [("source", 1), ("details.articleNumber", 1)],
-        name="idx_source_articleNumber",
-    )
+# Built by tools/ensure_indexes.py (and load_data.py); the API only checks they exist
+REQUIRED_INDEXES = (
+    "idx_details_upc",
+    "idx_details_gtin14",
+    "idx_product_text",
+    "idx_ingredient_tokens_id",
+    "idx_source_articleNumber",
+)
+
+
+def missing_indexes(collection: Collection) -> List[str]:
+    # listIndexes only reports finished builds, so an in-progress build counts as missing
+    existing = set(collection.index_information())
+    return [name for name in REQUIRED_INDEXES if name not in existing]
 
 
 def parse_preferred_sources() -> List[str]:
@@ -46,6 +242,1525 @@ def parse_preferred_sources() -> List[str]:
     return [s.strip() for s in raw.split(",") if s.strip()]
 
 
+MAX_BATCH_UPCS = 500
+
+
+def preferred_rank_stages(preferred: List[str]) -> List[Dict[str, Any]]:
+    """Stages adding __rank: index of source in preferred, 9999 when absent."""
+    return [
+        {
+            "$addFields": {
+                "__rank": {
+                    "$indexOfArray": [preferred, "$source"],
+                }
+            }
+        },
+        {
+            "$addFields": {
+                "__rank": {"$cond": [{"$eq": ["$__rank", -1]}, 9999, "$__rank"]}
+            }
+        },
+    ]
+
+
+UPC_FIELD = "details.upc"
+GTIN_FIELD = "details.gtin14"
+
+
+def lookup_key(upc_code: str) -> Tuple[str, str]:
+    """(field, value) to match for an incoming code: canonical GTIN-14 when possible."""
+    gtin = canonical_gtin14(upc_code)
+    if gtin:
+        return GTIN_FIELD, gtin
+    return UPC_FIELD, upc_code
+
+
+FIELD_PRESETS: Dict[str, Optional[List[str]]] = {
+    "full": None,
+    "summary": [
+        "productName",
+        "brand",
+        "imageUrl",
+        "source",
+        "category",
+        "details.upc",
+        "details.size",
+        "details.nutritionFacts",
+    ],
+}
+# Always projected so ETag / Last-Modified can be computed for partial documents
+VALIDATOR_FIELD_NAMES = ["contentHash", "scrapedAt"]
+VALIDATOR_FIELDS = {name: 1 for name in VALIDATOR_FIELD_NAMES}
+# Loader-derived fields that are never part of a product response. Whole-document
+# reads exclude the lookup keys and lastSeen in MongoDB; contentHash is still read
+# for ETags and removed by public_document. lastSeen changes on reloads that keep
+# contentHash, so serving it would change the body under the same strong ETag.
+INTERNAL_PROJECTION = {"details.gtin14": 0, "details.ingredientTokens": 0, "lastSeen": 0}
+INTERNAL_TOP_LEVEL_FIELDS = ("contentHash", "lastSeen")
+INTERNAL_DETAILS_FIELDS = ("gtin14", "ingredientTokens")
+MAX_REQUESTED_FIELDS = 30
+
+
+def parse_fields(raw: Optional[str]) -> Tuple[str, Optional[Dict[str, int]]]:
+    """Turn ?fields= into (variant key, Mongo inclusion projection).
+
+    Accepts a preset name ("summary", "full") or comma-separated dotted paths.
+    The variant key is "" for the full document and is part of cache keys and ETags.
+    """
+    if not raw or raw.strip() == "full":
+        return "", None
+    raw = raw.strip()
+    if raw in FIELD_PRESETS:
+        paths = list(FIELD_PRESETS[raw] or [])
+    else:
+        paths = [p.strip() for p in raw.split(",") if p.strip()]
+        if len(paths) > MAX_REQUESTED_FIELDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_REQUESTED_FIELDS} fields")
+        for path in paths:
+            parts = path.split(".")
+            if path == "_id" or not all(part and (part[0].isalpha() and part.replace("_", "").isalnum()) for part in parts):
+                raise HTTPException(status_code=400, detail=f"Invalid field: {path}")
+    paths.extend(VALIDATOR_FIELD_NAMES)
+    # Drop paths already covered by an ancestor; Mongo rejects such collisions
+    selected: List[str] = []
+    for path in sorted(set(paths)):
+        if not any(path.startswith(parent + ".") for parent in selected):
+            selected.append(path)
+    return ",".join(selected), {path: 1 for path in selected}
+
+
+def response_projection(fields: Optional[Dict[str, int]]) -> Dict[str, int]:
+    """Mongo projection for a response: whole document, or only the given fields, never _id."""
+    if fields:
+        return {"_id": 0, **fields}
+    return {"_id": 0, **INTERNAL_PROJECTION}
+
+
+def listing_projection(fields: Optional[Dict[str, int]]) -> Dict[str, int]:
+    """Projection for paginated listings, which keep _id for their cursors and send no validators."""
+    if fields:
+        return {"_id": 1, **{k: v for k, v in fields.items() if k not in INTERNAL_TOP_LEVEL_FIELDS}}
+    return {"contentHash": 0, **INTERNAL_PROJECTION}
+
+
+def public_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a product document without contentHash, lastSeen and the loader's derived lookup keys."""
+    result = {k: v for k, v in doc.items() if k not in INTERNAL_TOP_LEVEL_FIELDS}
+    details = result.get("details")
+    if isinstance(details, dict) and any(key in details for key in INTERNAL_DETAILS_FIELDS):
+        result["details"] = {k: v for k, v in details.items() if k not in INTERNAL_DETAILS_FIELDS}
+    return result
+
+
+def upc_lookup_pipeline(
+    field: str, value: str, preferred: List[str], fields: Optional[Dict[str, int]] = None
+) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {field: value}},
+        *preferred_rank_stages(preferred),
+        {"$sort": {"__rank": 1, "scrapedAt": -1}},
+        {"$limit": 1},
+        {"$project": response_projection(fields) if fields else {"_id": 0, "__rank": 0, **INTERNAL_PROJECTION}},
+    ]
+
+
+def upc_batch_pipeline(
+    field: str, values: List[str], preferred: List[str], fields: Optional[Dict[str, int]] = None
+) -> List[Dict[str, Any]]:
+    """One aggregation resolving every value of field in values.
+
+    A document listing several requested codes competes for each of them, so the
+    pipeline unwinds on the requested codes it carries before ranking.
+    """
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {field: {"$in": values}}},
+        {"$addFields": {"__upc": "$" + field}},
+        {"$unwind": "$__upc"},
+        {"$match": {"__upc": {"$in": values}}},
+    ]
+    if preferred:
+        pipeline.extend(preferred_rank_stages(preferred))
+        pipeline.append({"$sort": {"__upc": 1, "__rank": 1, "scrapedAt": -1}})
+    pipeline.extend(
+        [
+            {"$group": {"_id": "$__upc", "doc": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$doc"}},
+            {
+                "$project": {"_id": 0, "__upc": 1, **fields}
+                if fields
+                else {"_id": 0, "__rank": 0, **INTERNAL_PROJECTION}
+            },
+        ]
+    )
+    return pipeline
+
+
+def batch_results_by_upc(docs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    found: Dict[str, Dict[str, Any]] = {}
+    for doc in docs:
+        upc = doc.pop("__upc")
+        found[upc] = doc
+    return found
+
+
+BEST_PRODUCT_PROJECTION = {"rankedBy": 0, "rankedAt": 0, **INTERNAL_PROJECTION}
+
+
+def best_products_filter(upc_filter: Any, preferred: List[str]) -> Dict[str, Any]:
+    # rankedBy guards against entries materialized with a different source order
+    return {"_id": upc_filter, "rankedBy": ",".join(preferred)}
+
+
+def best_results_by_upc(docs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    found: Dict[str, Dict[str, Any]] = {}
+    for doc in docs:
+        upc = doc.pop("_id")
+        found[upc] = doc
+    return found
+
+
+def fetch_product(
+    products: Collection,
+    field: str,
+    value: str,
+    preferred: List[str],
+    best: Optional[Collection] = None,
+    fields: Optional[Dict[str, int]] = None,
+) -> Optional[Dict[str, Any]]:
+    if not preferred:
+        # Simple fast path
+        doc = products.find_one({field: value}, projection=response_projection(fields))
+        if not doc:
+            return None
+        return doc
+
+    if best is not None and field == GTIN_FIELD:
+        # Pre-ranked point read; fall back to ranking at query time on a miss
+        doc = best.find_one(
+            best_products_filter(value, preferred),
+            projection=response_projection(fields) if fields else BEST_PRODUCT_PROJECTION,
+        )
+        if doc:
+            doc.pop("_id", None)
+            return doc
+
+    results = list(products.aggregate(upc_lookup_pipeline(field, value, preferred, fields)))
+    if not results:
+        return None
+    return results[0]
+
+
+def fetch_products(
+    products: Collection,
+    values_by_field: Dict[str, List[str]],
+    preferred: List[str],
+    best: Optional[Collection] = None,
+    fields: Optional[Dict[str, int]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Resolve many codes with one aggregation per lookup field; returns only the values that matched."""
+    found: Dict[str, Dict[str, Any]] = {}
+    best_projection = fields or BEST_PRODUCT_PROJECTION
+    for field, values in values_by_field.items():
+        if preferred and best is not None and field == GTIN_FIELD and values:
+            hits = best_results_by_upc(
+                list(best.find(best_products_filter({"$in": values}, preferred), projection=best_projection))
+            )
+            found.update(hits)
+            values = [v for v in values if v not in hits]
+        if values:
+            pipeline = upc_batch_pipeline(field, values, preferred, fields)
+            found.update(batch_results_by_upc(list(products.aggregate(pipeline))))
+    return found
+
+
+async def fetch_product_async(
+    products: Any,
+    field: str,
+    value: str,
+    preferred: List[str],
+    best: Any = None,
+    fields: Optional[Dict[str, int]] = None,
+) -> Optional[Dict[str, Any]]:
+    if not preferred:
+        doc = await products.find_one({field: value}, projection=response_projection(fields))
+        if not doc:
+            return None
+        return doc
+
+    if best is not None and field == GTIN_FIELD:
+        doc = await best.find_one(
+            best_products_filter(value, preferred),
+            projection=response_projection(fields) if fields else BEST_PRODUCT_PROJECTION,
+        )
+        if doc:
+            doc.pop("_id", None)
+            return doc
+
+    results = await products.aggregate(upc_lookup_pipeline(field, value, preferred, fields)).to_list(length=1)
+    if not results:
+        return None
+    return results[0]
+
+
+async def fetch_products_async(
+    products: Any,
+    values_by_field: Dict[str, List[str]],
+    preferred: List[str],
+    best: Any = None,
+    fields: Optional[Dict[str, int]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    found: Dict[str, Dict[str, Any]] = {}
+    best_projection = fields or BEST_PRODUCT_PROJECTION
+    for field, values in values_by_field.items():
+        if preferred and best is not None and field == GTIN_FIELD and values:
+            cursor = best.find(best_products_filter({"$in": values}, preferred), projection=best_projection)
+            hits = best_results_by_upc(await cursor.to_list(length=None))
+            found.update(hits)
+            values = [v for v in values if v not in hits]
+        if values:
+            pipeline = upc_batch_pipeline(field, values, preferred, fields)
+            found.update(batch_results_by_upc(await products.aggregate(pipeline).to_list(length=None)))
+    return found
+
+
+MAX_SEARCH_LIMIT = 100
+
+
+def encode_search_cursor(score: float, last_id: ObjectId) -> str:
+    raw = json.dumps([score, str(last_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_search_cursor(token: str) -> Tuple[float, ObjectId]:
+    try:
+        score, last_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return float(score), ObjectId(last_id)
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def search_pipeline(
+    q: str,
+    sources: List[str],
+    categories: List[str],
+    limit: int,
+    after: Optional[Tuple[float, ObjectId]],
+) -> List[Dict[str, Any]]:
+    """Text-index search ranked by textScore, paginated by (score desc, _id asc)."""
+    match: Dict[str, Any] = {"$text": {"$search": q}}
+    if sources:
+        match["source"] = {"$in": sources}
+    if categories:
+        match["category"] = {"$in": categories}
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        {"$addFields": {"__score": {"$meta": "textScore"}}},
+    ]
+    if after is not None:
+        score, last_id = after
+        pipeline.append(
+            {"$match": {"$or": [{"__score": {"$lt": score}}, {"__score": score, "_id": {"$gt": last_id}}]}}
+        )
+    pipeline.extend(
+        [
+            {"$sort": {"__score": -1, "_id": 1}},
+            # One extra row tells whether another page exists
+            {"$limit": limit + 1},
+            {"$project": listing_projection(None)},
+        ]
+    )
+    return pipeline
+
+
+INGREDIENT_TOKENS_FIELD = "details.ingredientTokens"
+MAX_INGREDIENT_TERMS = 10
+
+
+def parse_ingredient_terms(raw: Optional[str]) -> List[str]:
+    if not raw:
+        return []
+    terms = list(dict.fromkeys(t for t in (normalize_ingredient_token(part) for part in raw.split(",")) if t))
+    if len(terms) > MAX_INGREDIENT_TERMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_INGREDIENT_TERMS} ingredient terms")
+    return terms
+
+
+def ingredient_query(
+    contains: List[str],
+    excludes: List[str],
+    sources: List[str],
+    categories: List[str],
+    after: Optional[ObjectId],
+) -> Dict[str, Any]:
+    """$all on the multikey token index selects candidates; $nin only filters them."""
+    tokens: Dict[str, Any] = {"$all": contains}
+    if excludes:
+        tokens["$nin"] = excludes
+    query: Dict[str, Any] = {INGREDIENT_TOKENS_FIELD: tokens}
+    if sources:
+        query["source"] = {"$in": sources}
+    if categories:
+        query["category"] = {"$in": categories}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    return query
+
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def encode_export_cursor(last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(last_id.binary).decode("ascii")
+
+
+def decode_export_cursor(token: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def scraped_at_range(after: Optional[str], before: Optional[str]) -> Optional[Dict[str, Any]]:
+    """scrapedAt >= after and < before, for documents storing it as an ISO string or as a date.
+
+    String bounds are compared in the loader's canonical form (canonical_scraped_at),
+    so "Z", "+00:00" and fractional-second bounds select the same documents.
+    """
+    bounds: List[Tuple[str, str]] = []
+    if after:
+        bounds.append(("$gte", after))
+    if before:
+        bounds.append(("$lt", before))
+    if not bounds:
+        return None
+    as_string: Dict[str, Any] = {}
+    as_date: Dict[str, Any] = {}
+    for op, raw in bounds:
+        parsed = parse_timestamp(raw)
+        if parsed is None:
+            raise HTTPException(status_code=400, detail=f"Invalid scrapedAt bound: {raw}")
+        as_string[op] = canonical_scraped_at(parsed)
+        as_date[op] = parsed
+    return {"$or": [{"scrapedAt": as_string}, {"scrapedAt": as_date}]}
+
+
+def export_query(
+    sources: List[str],
+    categories: List[str],
+    scraped_range: Optional[Dict[str, Any]],
+    after: Optional[ObjectId],
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if sources:
+        query["source"] = {"$in": sources}
+    if categories:
+        query["category"] = {"$in": categories}
+    if scraped_range:
+        query.update(scraped_range)
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    return query
+
+
+def export_line(doc: Dict[str, Any]) -> bytes:
+    # Every line carries the token to resume right after it
+    doc["_cursor"] = encode_export_cursor(doc.pop("_id"))
+    return dumps_json(doc) + b"\n"
+
+
+def iter_export(
+    products: Collection, query: Dict[str, Any], projection: Optional[Dict[str, int]], limit: int
+) -> Iterator[bytes]:
+    """NDJSON chunks over an _id-ordered cursor; holds at most one batch and one chunk in memory."""
+    cursor = products.find(query, projection=projection, sort=[("_id", 1)], limit=limit, batch_size=EXPORT_BATCH_SIZE)
+    try:
+        chunk: List[bytes] = []
+        size = 0
+        for doc in cursor:
+            line = export_line(doc)
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+    finally:
+        cursor.close()
+
+
+async def iter_export_async(
+    products: Any, query: Dict[str, Any], projection: Optional[Dict[str, int]], limit: int
+) -> AsyncIterator[bytes]:
+    cursor = products.find(query, projection=projection, sort=[("_id", 1)], limit=limit, batch_size=EXPORT_BATCH_SIZE)
+    try:
+        chunk: List[bytes] = []
+        size = 0
+        async for doc in cursor:
+            line = export_line(doc)
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+    finally:
+        await cursor.close()
+
+
+CacheKey = Tuple[str, Tuple[str, ...], str]
+
+
+class UpcCache:
+    """Bounded in-process LRU cache for UPC lookups with per-entry TTL.
+
+    Keys are (lookup value, preferred_sources, fields variant) tuples, where the
+    lookup value is the canonical GTIN-14 when the code has one. Values are CachedProduct
+    entries; None records a negative result (404) and expires after
+    negative_ttl seconds. Expired products stay available to get_stale() for a
+    further stale_ttl seconds as a last-known-good copy.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float, stale_ttl: float = 0.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Optional[CachedProduct]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: CacheKey) -> Tuple[bool, Optional["CachedProduct"]]:
+        """Return (found, value); value is None for a cached 404."""
+        if not self.enabled:
+            return False, None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None and (entry[1] is None or entry[0] + self.stale_ttl <= now):
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, entry[1]
+
+    def get_stale(self, key: CacheKey) -> Optional["CachedProduct"]:
+        """Return an expired product still inside the stale window, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] is None or entry[0] > now or entry[0] + self.stale_ttl <= now:
+                return None
+            self.stale_hits += 1
+            return entry[1]
+
+    def put(self, key: CacheKey, value: Optional["CachedProduct"]) -> None:
+        if not self.enabled:
+            return
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, upc: Optional[str] = None) -> int:
+        """Drop every entry for upc (any preferred-source list or fields), or all entries."""
+        with self._lock:
+            if upc is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [k for k in self._entries if k[0] == upc]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "negative_ttl_seconds": self.negative_ttl,
+                "stale_ttl_seconds": self.stale_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+
+def create_upc_cache() -> UpcCache:
+    return UpcCache(
+        max_size=int(os.environ.get("UPC_CACHE_SIZE", "10000")),
+        ttl=float(os.environ.get("UPC_CACHE_TTL_SECONDS", "300")),
+        negative_ttl=float(os.environ.get("UPC_CACHE_NEGATIVE_TTL_SECONDS", "60")),
+        stale_ttl=float(os.environ.get("UPC_CACHE_STALE_SECONDS", "3600")),
+    )
+
+
+class MongoUnavailable(Exception):
+    """MongoDB timed out, is unreachable, or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for MongoDB calls on the request path.
+
+    After failure_threshold consecutive timeouts/connection errors the breaker
+    opens and calls fail fast for reset_seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.opens = 0
+        self.rejections = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(1, math.ceil(self.reset_seconds - (time.monotonic() - self._opened_at)))
+
+    def allow(self) -> bool:
+        if not self.enabled:
+            return True
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejections += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_in_flight:
+                    self.opens += 1
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Give up a half-open trial that ended without an outcome (cancelled or non-MongoDB error)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._state(time.monotonic())
+            return {
+                "state": state,
+                "open": 0 if state == "closed" else 1,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "opens": self.opens,
+                "rejections": self.rejections,
+            }
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=int(os.environ.get("MONGO_BREAKER_FAILURES", "5")),
+        reset_seconds=float(os.environ.get("MONGO_BREAKER_RESET_SECONDS", "30")),
+    )
+
+
+def is_unavailable_error(exc: PyMongoError) -> bool:
+    # Timeouts and network/server-selection failures trip the breaker; query errors do not
+    return isinstance(exc, ConnectionFailure) or getattr(exc, "timeout", False)
+
+
+class UpcFilter:
+    """Negative cache answering "definitely absent" for unknown barcodes.
+
+    Built from MongoDB (source "mongo") or loaded from a snapshot file written by
+    load_data.py --bloom-snapshot, and refreshed every refresh_seconds in a
+    background thread (0: load once). Every uvicorn worker holds its own filter,
+    so a mongo build is a full collection scan per worker; the snapshot file is
+    the shared source for multi-worker deployments. Until the first build
+    completes every key passes.
+    """
+
+    def __init__(self, source: str, fp_rate: float, refresh_seconds: float) -> None:
+        self.source = source
+        self.fp_rate = fp_rate
+        self.refresh_seconds = refresh_seconds
+        self.bloom: Optional[BloomFilter] = None
+        self.built_at: Optional[float] = None
+        self.snapshot_mtime: Optional[float] = None
+        self.checks = 0
+        self.rejections = 0
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.source)
+
+    def might_contain(self, key: str) -> bool:
+        bloom = self.bloom
+        if bloom is None:
+            return True
+        self.checks += 1
+        if key in bloom:
+            return True
+        self.rejections += 1
+        return False
+
+    def refresh(self, products: Collection) -> bool:
+        """Rebuild or reload the filter; returns True when a new filter was installed."""
+        with self._refresh_lock:
+            if self.source == "mongo":
+                bloom = build_bloom_from_collection(products, self.fp_rate)
+            else:
+                mtime = os.path.getmtime(self.source)
+                if mtime == self.snapshot_mtime:
+                    return False
+                with open(self.source, "rb") as f:
+                    bloom = BloomFilter.from_bytes(f.read())
+                self.snapshot_mtime = mtime
+            self.bloom = bloom
+            self.built_at = time.time()
+            return True
+
+    def run_refresh_loop(self, products: Collection) -> None:
+        while True:
+            try:
+                self.refresh(products)
+            except Exception:
+                logger.exception("UPC filter refresh failed; keeping previous filter")
+            if self.refresh_seconds <= 0:
+                return
+            time.sleep(self.refresh_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        bloom = self.bloom
+        return {
+            "enabled": self.enabled,
+            "source": self.source,
+            "ready": bloom is not None,
+            "built_at": self.built_at,
+            "keys": bloom.count if bloom else 0,
+            "num_bits": bloom.num_bits if bloom else 0,
+            "num_hashes": bloom.num_hashes if bloom else 0,
+            "memory_bytes": bloom.memory_bytes if bloom else 0,
+            "estimated_fp_rate": bloom.estimated_fp_rate if bloom else None,
+            "checks": self.checks,
+            "rejections": self.rejections,
+        }
+
+
+def build_bloom_from_collection(products: Collection, fp_rate: float) -> BloomFilter:
+    # Sized for roughly one UPC and one GTIN-14 per document, with headroom
+    capacity = int(products.estimated_document_count() * 2.5) + 1000
+    bloom = BloomFilter.for_capacity(capacity, fp_rate)
+    cursor = products.find({}, projection={"_id": 0, UPC_FIELD: 1, GTIN_FIELD: 1}, batch_size=10000)
+    for doc in cursor:
+        details = doc.get("details") or {}
+        for key in set(details.get("upc") or []) | set(details.get("gtin14") or []):
+            bloom.add(key)
+    return bloom
+
+
+def create_upc_filter() -> UpcFilter:
+    source = os.environ.get("UPC_BLOOM_FILTER", "").strip()
+    # Reloading a snapshot is a stat() until the file changes; periodic mongo rebuilds must be opted into
+    default_refresh = "0" if source == "mongo" else "600"
+    return UpcFilter(
+        source=source,
+        fp_rate=float(os.environ.get("UPC_BLOOM_FP_RATE", "0.01")),
+        refresh_seconds=float(os.environ.get("UPC_BLOOM_REFRESH_SECONDS", default_refresh)),
+    )
+
+
+def start_upc_filter(upc_filter: UpcFilter, products: Collection) -> None:
+    if not upc_filter.enabled:
+        return
+    thread = threading.Thread(
+        target=upc_filter.run_refresh_loop, args=(products,), name="upc-filter-refresh", daemon=True
+    )
+    thread.start()
+
+
+class ProductSnapshot:
+    """The current product snapshot for this worker, reloaded when the file's mtime changes.
+
+    A snapshot ranked with a different source list than PREFERRED_SOURCES is
+    not used, so it never answers with a product the query path would not pick.
+    Replaced mappings are left to garbage collection so in-flight reads stay valid.
+    """
+
+    def __init__(self, path: str, preferred: List[str], refresh_seconds: float) -> None:
+        self.path = path
+        self.preferred = preferred
+        self.refresh_seconds = refresh_seconds
+        self.file: Optional[ProductSnapshotFile] = None
+        self.mtime: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def get(self, gtin14: str) -> Optional[Tuple[bytes, Optional[str], Optional[str]]]:
+        snapshot = self.file
+        if snapshot is None:
+            return None
+        found = snapshot.get(gtin14)
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def refresh(self) -> bool:
+        """Map the file again if it changed; returns True when a new snapshot was installed."""
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return False
+        snapshot = ProductSnapshotFile(self.path)
+        self.mtime = mtime
+        ranked_by = snapshot.meta.get("rankedBy", [])
+        if ranked_by != self.preferred:
+            self.file = None
+            self.error = f"snapshot ranked by {ranked_by}, PREFERRED_SOURCES is {self.preferred}"
+            logger.warning("Ignoring product snapshot %s: %s", self.path, self.error)
+            return False
+        self.file = snapshot
+        self.error = None
+        self.loaded_at = time.time()
+        return True
+
+    def run_refresh_loop(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except (OSError, ValueError, struct.error):
+                logger.exception("Product snapshot reload failed; keeping previous snapshot")
+            if self.refresh_seconds <= 0:
+                return
+            time.sleep(self.refresh_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.file
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "ready": snapshot is not None,
+            "loaded_at": self.loaded_at,
+            "created_at": snapshot.meta.get("createdAt") if snapshot else None,
+            "keys": snapshot.count if snapshot else 0,
+            "size_bytes": snapshot.size_bytes if snapshot else 0,
+            "error": self.error,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_product_snapshot(preferred: List[str]) -> ProductSnapshot:
+    return ProductSnapshot(
+        path=os.environ.get("PRODUCT_SNAPSHOT", "").strip(),
+        preferred=preferred,
+        refresh_seconds=float(os.environ.get("PRODUCT_SNAPSHOT_REFRESH_SECONDS", "60")),
+    )
+
+
+def start_product_snapshot(snapshot: ProductSnapshot) -> None:
+    if not snapshot.enabled:
+        return
+    try:
+        # Mapping is cheap; load synchronously so the first requests can use it
+        snapshot.refresh()
+    except (OSError, ValueError, struct.error):
+        logger.exception("Could not load product snapshot %s", snapshot.path)
+    if snapshot.refresh_seconds > 0:
+        threading.Thread(target=snapshot.run_refresh_loop, name="product-snapshot-refresh", daemon=True).start()
+
+
+def product_etag(doc: Dict[str, Any], variant: str = "") -> str:
+    """Strong ETag for a product response.
+
+    Documents written by load_data.py carry contentHash (everything except
+    scrapedAt and lastSeen, which is never served), so the tag can be derived
+    from the two validator fields alone and checked with a projected query.
+    Older documents hash the full body.
+    """
+    content_hash = doc.get("contentHash")
+    if content_hash:
+        basis = f"{content_hash}|{doc.get('scrapedAt')}|{variant}"
+    else:
+        basis = json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return '"' + hashlib.sha256(basis.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def parse_scraped_at(value: Any) -> Optional[datetime]:
+    # Last-Modified must be GMT (format_datetime(usegmt=True) rejects other offsets) with whole seconds
+    parsed = parse_timestamp(value)
+    return parsed.replace(microsecond=0) if parsed is not None else None
+
+
+def validator_headers(doc: Dict[str, Any], variant: str = "") -> Dict[str, str]:
+    headers = {
+        "ETag": product_etag(doc, variant),
+        "Cache-Control": f"public, max-age={int(os.environ.get('PRODUCT_CACHE_MAX_AGE', '300'))}",
+    }
+    last_modified = parse_scraped_at(doc.get("scrapedAt"))
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against a product's validator headers."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        # Tags of any representation (format/content-coding suffix) of this version match
+        etag = etag_base(headers["ETag"])
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return any(etag_base(t[2:] if t.startswith("W/") else t) == etag for t in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("Last-Modified")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(last_modified) <= since
+    return False
+
+
+def json_default(value: Any) -> Any:
+    # Same shapes jsonable_encoder produced for BSON-decoded documents
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def loads_json(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "cbor": "application/cbor",
+}
+ACCEPT_ALIASES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/cbor": "cbor",
+}
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def etag_base(tag: str) -> str:
+    return tag.strip('"').split("-", 1)[0]
+
+
+def parse_quality_list(header: str) -> List[Tuple[str, float]]:
+    """Parse an Accept/Accept-Encoding header into (token, q) pairs, highest q first."""
+    items: List[Tuple[str, float]] = []
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if token and q > 0:
+            items.append((token.strip().lower(), q))
+    items.sort(key=lambda item: -item[1])
+    return items
+
+
+def negotiate_format(request: Request) -> str:
+    for token, _ in parse_quality_list(request.headers.get("accept", "")):
+        fmt = ACCEPT_ALIASES.get(token)
+        if fmt == "msgpack" and msgpack is None or fmt == "cbor" and cbor2 is None:
+            continue
+        if fmt:
+            return fmt
+    return "json"
+
+
+def negotiate_coding(request: Request) -> Optional[str]:
+    for token, _ in parse_quality_list(request.headers.get("accept-encoding", "")):
+        if token == "br" and brotli is not None:
+            return "br"
+        if token == "gzip":
+            return "gzip"
+    return None
+
+
+def compact_document(value: Any) -> Any:
+    """Drop None and empty values recursively, like the spiders' get_details, for compact encodings."""
+    if isinstance(value, dict):
+        result = {}
+        for k, v in value.items():
+            v = compact_document(v)
+            if v is None or v == "" or v == [] or v == {}:
+                continue
+            result[k] = v
+        return result
+    if isinstance(value, (list, tuple)):
+        return [compact_document(v) for v in value if v is not None]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def shape_product(doc: Optional[Dict[str, Any]], fmt: str) -> Optional[Dict[str, Any]]:
+    """Compact a product document for binary formats; JSON keeps the document as stored."""
+    if doc is None or fmt == "json":
+        return doc
+    return compact_document(doc)
+
+
+def encode_body(content: Any, fmt: str) -> bytes:
+    if fmt == "msgpack":
+        return msgpack.packb(content, default=json_default, use_bin_type=True)
+    if fmt == "cbor":
+        return cbor2.dumps(content, default=lambda encoder, value: encoder.encode(json_default(value)))
+    return dumps_json(content)
+
+
+def compress_body(body: bytes, coding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if coding is None or len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+
+
+def representation_headers(headers: Dict[str, str], fmt: str, coding: Optional[str]) -> Dict[str, str]:
+    result = dict(headers)
+    result["Vary"] = "Accept, Accept-Encoding"
+    if "ETag" in result:
+        suffix = "".join(f"-{part}" for part in (fmt if fmt != "json" else None, coding) if part)
+        if suffix:
+            result["ETag"] = result["ETag"][:-1] + suffix + '"'
+    if coding:
+        result["Content-Encoding"] = coding
+    return result
+
+
+def negotiated_response(request: Request, fmt: str, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Encode and compress an uncached payload in fmt, compressed according to Accept-Encoding."""
+    body, coding = compress_body(encode_body(content, fmt), negotiate_coding(request))
+    return Response(
+        content=body,
+        media_type=MEDIA_TYPES[fmt],
+        headers=representation_headers(headers or {}, fmt, coding),
+    )
+
+
+class CachedProduct:
+    """A product document with its serialized body and validator headers, computed once.
+
+    variant is the ?fields= key the document was projected with ("" for full).
+    doc is stored as its public_document; the contentHash it carried (or the
+    one given) and scrapedAt feed the ETag and Last-Modified.
+    """
+
+    __slots__ = ("_doc", "variant", "content_hash", "scraped_at", "_body", "_headers", "_representations")
+
+    def __init__(self, doc: Dict[str, Any], variant: str = "", content_hash: Optional[str] = None) -> None:
+        self.content_hash = content_hash or doc.get("contentHash")
+        self._doc: Optional[Dict[str, Any]] = public_document(doc)
+        self.scraped_at = doc.get("scrapedAt")
+        self.variant = variant
+        self._body: Optional[bytes] = None
+        self._headers: Optional[Dict[str, str]] = None
+        self._representations: Dict[Tuple[str, Optional[str]], Tuple[bytes, Dict[str, str]]] = {}
+
+    @classmethod
+    def from_body(
+        cls, body: bytes, content_hash: Optional[str] = None, scraped_at: Optional[str] = None
+    ) -> "CachedProduct":
+        """Full-document entry whose public JSON body is already encoded (product snapshot blobs).
+
+        The body is served as-is and only decoded when doc is needed (other
+        formats, batch results, or an ETag for a document without contentHash).
+        """
+        entry = cls({}, content_hash=content_hash)
+        entry._doc = None
+        entry._body = body
+        entry.scraped_at = scraped_at
+        return entry
+
+    @property
+    def doc(self) -> Dict[str, Any]:
+        if self._doc is None:
+            self._doc = loads_json(self._body)
+        return self._doc
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = dumps_json(self.doc)
+        return self._body
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        if self._headers is None:
+            if self.content_hash:
+                validators = {"contentHash": self.content_hash, "scrapedAt": self.scraped_at}
+            else:
+                validators = self.doc
+            self._headers = validator_headers(validators, self.variant)
+        return self._headers
+
+    def representation(self, fmt: str, coding: Optional[str]) -> Tuple[bytes, Dict[str, str]]:
+        """Encoded (and possibly compressed) body with its headers, memoized per format and coding."""
+        key = (fmt, coding)
+        cached = self._representations.get(key)
+        if cached is None:
+            body = self.body if fmt == "json" else encode_body(shape_product(self.doc, fmt), fmt)
+            body, applied = compress_body(body, coding)
+            cached = (body, representation_headers(self.headers, fmt, applied))
+            self._representations[key] = cached
+        return cached
+
+
+class UpcBatchRequest(BaseModel):
+    upcs: List[str]
+    fields: Optional[str] = None
+
+
+def require_admin(token: Optional[str]) -> None:
+    # Fail closed: without a configured token the admin endpoints are disabled
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if token is None or not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+CNF_FILES = ("FOOD NAME", "NUTRIENT AMOUNT", "NUTRIENT NAME", "MEASURE NAME", "CONVERSION FACTOR", "FOOD SOURCE")
+MAX_CNF_SEARCH_LIMIT = 50
+
+
+def cnf_number(raw: Optional[str]) -> Any:
+    """CSV cell as int or float when numeric, None when empty, else the stripped string."""
+    if raw is None:
+        return None
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    try:
+        return float(raw)
+    except ValueError:
+        return raw
+
+
+class CnfIndex:
+    """Canadian Nutrient File tables loaded once into dicts keyed by FoodID.
+
+    Same CSVs and response shape as canadian_nutrient_file.py, but each food
+    keeps its own (NutrientID, value) and (MeasureID, factor) rows, so a lookup
+    touches only that food's rows instead of masking and merging whole tables.
+    Search scans a precomputed casefolded English/French name per food.
+    """
+
+    def __init__(self, data_dir: str) -> None:
+        self.data_dir = data_dir
+        self.foods: Dict[int, Dict[str, Any]] = {}
+        self.nutrients_by_food: Dict[int, List[Tuple[int, Any]]] = {}
+        self.servings_by_food: Dict[int, List[Tuple[int, Any]]] = {}
+        self.nutrient_names: Dict[int, Dict[str, Any]] = {}
+        self.measures: Dict[int, Any] = {}
+        self.food_sources: Dict[int, Any] = {}
+        self.search_order: List[Tuple[int, str]] = []
+        self.ready = False
+        self.error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.data_dir)
+
+    def _rows(self, name: str) -> Iterator[Dict[str, str]]:
+        # CNF ships Latin-1 CSVs (French descriptions)
+        with open(os.path.join(self.data_dir, f"{name}.csv"), "r", encoding="latin1", newline="") as f:
+            yield from csv.DictReader(f)
+
+    def load(self) -> None:
+        started = time.perf_counter()
+        foods = {}
+        for row in self._rows("FOOD NAME"):
+            food_id = cnf_number(row["FoodID"])
+            foods[food_id] = {
+                "food_id": food_id,
+                "food_code": cnf_number(row.get("FoodCode")),
+                "food_name": row.get("FoodDescription"),
+                "food_name_french": row.get("FoodDescriptionF"),
+                "food_group_id": cnf_number(row.get("FoodGroupID")),
+                "food_source": cnf_number(row.get("FoodSourceID")),
+                "date_of_entry": row.get("FoodDateOfEntry"),
+            }
+        nutrients_by_food: Dict[int, List[Tuple[int, Any]]] = {}
+        for row in self._rows("NUTRIENT AMOUNT"):
+            nutrients_by_food.setdefault(cnf_number(row["FoodID"]), []).append(
+                (cnf_number(row["NutrientID"]), cnf_number(row.get("NutrientValue")))
+            )
+        servings_by_food: Dict[int, List[Tuple[int, Any]]] = {}
+        for row in self._rows("CONVERSION FACTOR"):
+            servings_by_food.setdefault(cnf_number(row["FoodID"]), []).append(
+                (cnf_number(row["MeasureID"]), cnf_number(row.get("ConversionFactorValue")))
+            )
+        nutrient_names = {
+            cnf_number(row["NutrientID"]): {
+                "symbol": row.get("NutrientSymbol"),
+                "name": row.get("NutrientName"),
+                "unit": row.get("NutrientUnit"),
+            }
+            for row in self._rows("NUTRIENT NAME")
+        }
+        measures = {cnf_number(row["MeasureID"]): row.get("MeasureDescription") for row in self._rows("MEASURE NAME")}
+        food_sources = {
+            cnf_number(row["FoodSourceID"]): row.get("FoodSourceDescription") for row in self._rows("FOOD SOURCE")
+        }
+        search_order = [
+            (food_id, f"{food['food_name'] or ''}\n{food['food_name_french'] or ''}".casefold())
+            for food_id, food in foods.items()
+        ]
+
+        self.foods, self.nutrients_by_food, self.servings_by_food = foods, nutrients_by_food, servings_by_food
+        self.nutrient_names, self.measures, self.food_sources = nutrient_names, measures, food_sources
+        self.search_order = search_order
+        self.ready = True
+        logger.info("CNF loaded: %d foods in %.1fs", len(foods), time.perf_counter() - started)
+
+    def run_load(self) -> None:
+        try:
+            self.load()
+        except (OSError, KeyError, csv.Error) as exc:
+            self.error = str(exc)
+            logger.warning("Unable to load CNF files from %s: %s", self.data_dir, exc)
+
+    def food(self, food_id: int) -> Optional[Dict[str, Any]]:
+        food = self.foods.get(food_id)
+        if food is None:
+            return None
+        nutrition_facts = {}
+        for nutrient_id, value in self.nutrients_by_food.get(food_id, []):
+            names = self.nutrient_names.get(nutrient_id, {})
+            nutrition_facts[names.get("symbol")] = {
+                "name": names.get("name"),
+                "value": value,
+                "unit": names.get("unit"),
+            }
+        serving_sizes = [
+            {"measure_id": measure_id, "description": self.measures.get(measure_id), "conversion_factor": factor}
+            for measure_id, factor in self.servings_by_food.get(food_id, [])
+        ]
+        return {
+            **food,
+            "food_source_description": self.food_sources.get(food["food_source"]),
+            "nutrition_facts": nutrition_facts,
+            "serving_sizes": serving_sizes,
+            "total_nutrients": len(nutrition_facts),
+            "total_serving_sizes": len(serving_sizes),
+        }
+
+    def search(self, q: str, limit: int) -> Dict[str, Any]:
+        needle = q.casefold()
+        matches = [food_id for food_id, haystack in self.search_order if needle in haystack]
+        fields = ("food_id", "food_code", "food_name", "food_name_french", "food_group_id")
+        results = [{k: self.foods[food_id][k] for k in fields} for food_id in matches[:limit]]
+        return {"results": results, "total_found": len(matches), "showing": len(results)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "data_dir": self.data_dir,
+            "foods": len(self.foods),
+            "nutrients": len(self.nutrient_names),
+            "error": self.error,
+        }
+
+
+def create_cnf_index() -> CnfIndex:
+    data_dir = os.environ.get("CNF_DATA_DIR", "./backend/cnf-fcen-csv").strip()
+    return CnfIndex(data_dir if data_dir and os.path.isdir(data_dir) else "")
+
+
+def start_cnf_index(cnf: CnfIndex) -> None:
+    if not cnf.enabled:
+        return
+    threading.Thread(target=cnf.run_load, name="cnf-load", daemon=True).start()
+
+
+OCR_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+OCR_CONTENT_TYPES = ("image/jpeg", "image/jpg", "image/png", "image/gif", "image/bmp", "image/webp")
+OCR_MAX_SIDE = 2500
+# Digit groups as printed under barcodes ("0 12345 67890 5", "4-006381-33393-1")
+OCR_DIGIT_RUN = re.compile(r"\d(?:[ -]?\d){7,13}")
+
+
+def ocr_worker_init() -> None:
+    # Runs once per pool process: imports are loaded and the tesseract binary is checked up front
+    pytesseract.get_tesseract_version()
+
+
+def ocr_worker_ready() -> int:
+    return os.getpid()
+
+
+def preprocess_image(data: bytes, dpi: int) -> "Image.Image":
+    """Grayscale, upright image downscaled to roughly dpi (and at most OCR_MAX_SIDE pixels per side)."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    image = image.convert("L")
+    source_dpi = image.info.get("dpi", (0, 0))[0] or 0
+    scale = min(1.0, dpi / source_dpi) if source_dpi else 1.0
+    scale = min(scale, OCR_MAX_SIDE / max(image.size))
+    if scale < 1.0:
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+    return image
+
+
+def ocr_image(data: bytes, lang: str, psm: int, dpi: int, timeout: float) -> str:
+    """Preprocess and OCR one image; runs inside an OCR pool process."""
+    image = preprocess_image(data, dpi)
+    return pytesseract.image_to_string(image, lang=lang, config=f"--psm {psm} --dpi {dpi}", timeout=timeout)
+
+
+def extract_upc_candidates(text: str) -> List[str]:
+    """8-14 digit runs from OCR text, separators removed, in order of appearance."""
+    candidates = []
+    for match in OCR_DIGIT_RUN.finditer(text):
+        digits = re.sub(r"[ -]", "", match.group())
+        if 8 <= len(digits) <= 14:
+            candidates.append(digits)
+    return list(dict.fromkeys(candidates))
+
+
+def create_ocr_pool() -> Optional[ProcessPoolExecutor]:
+    workers = int(os.environ.get("OCR_WORKERS", "2"))
+    if workers <= 0 or pytesseract is None:
+        return None
+    try:
+        pytesseract.get_tesseract_version()
+    except (OSError, pytesseract.TesseractNotFoundError) as exc:
+        logger.warning("OCR disabled: tesseract binary not available (%s)", exc)
+        return None
+    # spawn, not fork: the API process already runs threads (filter refresh, driver monitors)
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=ocr_worker_init
+    )
+    # Start every worker now instead of on the first upload
+    for _ in range(workers):
+        pool.submit(ocr_worker_ready)
+    return pool
+
+
+async def rebuild_ocr_pool(broken: ProcessPoolExecutor) -> None:
+    """Replace a broken OCR pool (a worker died) so OCR recovers without a restart."""
+    if app.state.ocr_pool is not broken:
+        # Another request already replaced it
+        return
+    app.state.ocr_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    logger.warning("OCR worker pool broke; starting a new one")
+    app.state.ocr_pool = await run_in_threadpool(create_ocr_pool)
+
+
+def read_hot_upcs(path: str) -> List[str]:
+    """UPCs from a JSON list, a JSON object with "upcs" (load_test.py seed output), or one per line."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        data = json.loads(text)
+        upcs = data.get("upcs", []) if isinstance(data, dict) else data
+    else:
+        upcs = text.splitlines()
+    return list(dict.fromkeys(str(u).strip() for u in upcs if str(u).strip()))
+
+
+class StartupChecks:
+    """MongoDB checks and cache prewarm run in a background thread after startup.
+
+    The process is live as soon as it serves HTTP; it is ready once MongoDB
+    answers a ping and the required indexes exist (unless require_indexes is
+    off). Both checks are retried every retry_seconds until they pass, so a pod
+    becomes ready by itself once tools/ensure_indexes.py finishes. Prewarming
+    runs after the first successful ping and never gates readiness.
+    """
+
+    def __init__(self, require_indexes: bool, retry_seconds: float, prewarm_path: str, prewarm_max: int) -> None:
+        self.require_indexes = require_indexes
+        self.retry_seconds = retry_seconds
+        self.prewarm_path = prewarm_path
+        self.prewarm_max = prewarm_max
+        self.started_at = time.time()
+        self.mongo_ok = False
+        self.missing_indexes: Optional[List[str]] = None
+        self.last_error: Optional[str] = None
+        self.ready_at: Optional[float] = None
+        self.prewarm_state = "disabled" if not prewarm_path else "pending"
+        self.prewarmed = 0
+
+    @property
+    def ready(self) -> bool:
+        if not self.mongo_ok or self.missing_indexes is None:
+            return False
+        return not (self.require_indexes and self.missing_indexes)
+
+    def check(self, client: MongoClient, products: Collection) -> None:
+        try:
+            client.admin.command("ping")
+            self.mongo_ok = True
+            missing = missing_indexes(products)
+            if missing and missing != self.missing_indexes:
+                logger.warning("Missing indexes %s; run tools/ensure_indexes.py", ", ".join(missing))
+            self.missing_indexes = missing
+            self.last_error = None
+        except PyMongoError as exc:
+            self.mongo_ok = False
+            self.last_error = str(exc)
+            logger.warning("Startup check failed: %s", exc)
+        if self.ready and self.ready_at is None:
+            self.ready_at = time.time()
+
+    def prewarm(self, app: FastAPI) -> None:
+        self.prewarm_state = "running"
+        try:
+            upcs = read_hot_upcs(self.prewarm_path)[: self.prewarm_max]
+            preferred: List[str] = app.state.preferred_sources
+            cache: UpcCache = app.state.upc_cache
+            for start in range(0, len(upcs), MAX_BATCH_UPCS):
+                values_by_field: Dict[str, List[str]] = {}
+                for upc in upcs[start : start + MAX_BATCH_UPCS]:
+                    field, value = lookup_key(upc)
+                    values_by_field.setdefault(field, []).append(value)
+                fetched = fetch_products(app.state.products, values_by_field, preferred, app.state.best_products)
+                for doc_value, doc in fetched.items():
+                    cache.put((doc_value, tuple(preferred), ""), CachedProduct(doc))
+                self.prewarmed += len(fetched)
+            self.prewarm_state = "done"
+        except (OSError, ValueError, PyMongoError) as exc:
+            self.prewarm_state = "failed"
+            logger.warning("Cache prewarm from %s failed: %s", self.prewarm_path, exc)
+
+    def run(self, app: FastAPI) -> None:
+        while True:
+            self.check(app.state.mongo_client, app.state.products)
+            if self.mongo_ok and self.prewarm_state == "pending":
+                self.prewarm(app)
+            if self.ready and self.prewarm_state != "pending":
+                return
+            time.sleep(self.retry_seconds)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "mongo": self.mongo_ok,
+            "missing_indexes": self.missing_indexes,
+            "require_indexes": self.require_indexes,
+            "last_error": self.last_error,
+            "started_at": self.started_at,
+            "ready_at": self.ready_at,
+            "prewarm": {"state": self.prewarm_state, "path": self.prewarm_path or None, "products": self.prewarmed},
+        }
+
+
+def create_startup_checks() -> StartupChecks:
+    return StartupChecks(
+        require_indexes=os.environ.get("REQUIRE_INDEXES", "1").strip().lower() not in ("0", "false", "no"),
+        retry_seconds=float(os.environ.get("STARTUP_CHECK_RETRY_SECONDS", "10")),
+        prewarm_path=os.environ.get("PREWARM_UPCS_FILE", "").strip(),
+        prewarm_max=int(os.environ.get("PREWARM_MAX_UPCS", os.environ.get("UPC_CACHE_SIZE", "10000"))),
+    )
+
+
+def start_startup_checks(checks: StartupChecks, app: FastAPI) -> None:
+    thread = threading.Thread(target=checks.run, args=(app,), name="startup-checks", daemon=True)
+    thread.start()
+
+
 def init_db(app: FastAPI) -> None:
     mongo_uri = os.environ.get("MONGODB_URI")
     if not mongo_uri:
@@ -58,72 +1773,642 @@ def init_db(app: FastAPI) -> None:
 
     products: Collection = db["products"]
 
-    # Ensure required indexes and ping
-    ensure_indexes(products)
-    client.admin.command("ping")
-
     app.state.mongo_client = client
     app.state.db = db
     app.state.products = products
+
+    # Optional materialized best-product-per-UPC collection maintained by load_data.py
+    best_collection_name = os.environ.get("BEST_PRODUCTS_COLLECTION", "").strip()
+    app.state.best_products = db[best_collection_name] if best_collection_name else None
+
+    # Optional async request path; startup work above stays on the sync client
+    app.state.mongo_driver = parse_mongo_driver()
+    app.state.async_mongo_client = None
+    app.state.async_products = None
+    app.state.async_best_products = None
+    if app.state.mongo_driver == "async":
+        async_client = get_async_mongo_client(mongo_uri)
+        app.state.async_mongo_client = async_client
+        app.state.async_products = async_client[db.name]["products"]
+        if best_collection_name:
+            app.state.async_best_products = async_client[db.name][best_collection_name]
     app.state.preferred_sources = parse_preferred_sources()
+    app.state.upc_cache = create_upc_cache()
+    app.state.mongo_breaker = create_circuit_breaker()
+    timeout_ms = float(os.environ.get("MONGO_OPERATION_TIMEOUT_MS", "2000"))
+    app.state.mongo_operation_timeout = timeout_ms / 1000 if timeout_ms > 0 else None
+    app.state.revalidating = set()
+    app.state.revalidation_tasks = set()
+    app.state.upc_filter = create_upc_filter()
+    start_upc_filter(app.state.upc_filter, products)
+    app.state.product_snapshot = create_product_snapshot(app.state.preferred_sources)
+    start_product_snapshot(app.state.product_snapshot)
+
+    app.state.ocr_pool = create_ocr_pool()
+    app.state.cnf = create_cnf_index()
+    start_cnf_index(app.state.cnf)
+
+    # Ping, index verification and prewarm run off the startup path; see /health/ready
+    app.state.startup_checks = create_startup_checks()
+    start_startup_checks(app.state.startup_checks, app)
 
 
 app = FastAPI(title="WellAware API", version="0.1.0")
 
-# Allow GET requests from all origins for development
+# Allow GET (and batch POST) requests from all origins for development
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=False,
-    allow_methods=["GET"],
-    allow_headers=["*"]
+    allow_methods=["GET", "POST"],
+    allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Cache-Status"],
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next: Any) -> Response:
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        # Label by route template so per-UPC paths don't explode cardinality
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REQUEST_LATENCY.observe((path, request.method, status), time.perf_counter() - started)
+
+
 @app.on_event("startup")
 def on_startup() -> None:
     init_db(app)
 
 
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    if getattr(app.state, "ocr_pool", None) is not None:
+        app.state.ocr_pool.shutdown(wait=False, cancel_futures=True)
+    if getattr(app.state, "async_mongo_client", None) is not None:
+        app.state.async_mongo_client.close()
+    if getattr(app.state, "mongo_client", None) is not None:
+        app.state.mongo_client.close()
+
+
+def call_with_timeout(timeout: Optional[float], call: Callable[[], Any]) -> Any:
+    with pymongo.timeout(timeout):
+        return call()
+
+
+async def run_mongo(sync_call: Callable[[], Any], async_call: Callable[[], Any]) -> Any:
+    """Run a request-path MongoDB call under the per-operation timeout and the circuit breaker."""
+    breaker: CircuitBreaker = app.state.mongo_breaker
+    if not breaker.allow():
+        raise MongoUnavailable("circuit breaker open")
+    timeout = app.state.mongo_operation_timeout
+    try:
+        if getattr(app.state, "async_products", None) is not None:
+            with pymongo.timeout(timeout):
+                result = await async_call()
+        else:
+            result = await run_in_threadpool(call_with_timeout, timeout, sync_call)
+    except PyMongoError as exc:
+        if not is_unavailable_error(exc):
+            breaker.record_success()
+            raise
+        breaker.record_failure()
+        raise MongoUnavailable(str(exc)) from exc
+    except BaseException:
+        # Cancelled requests (client disconnects) must not hold the half-open trial slot forever
+        breaker.release_trial()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def lookup_product(
+    field: str, value: str, preferred: List[str], fields: Optional[Dict[str, int]] = None
+) -> Optional[Dict[str, Any]]:
+    return await run_mongo(
+        lambda: fetch_product(app.state.products, field, value, preferred, app.state.best_products, fields),
+        lambda: fetch_product_async(
+            app.state.async_products, field, value, preferred, app.state.async_best_products, fields
+        ),
+    )
+
+
+async def lookup_products(
+    values_by_field: Dict[str, List[str]], preferred: List[str], fields: Optional[Dict[str, int]] = None
+) -> Dict[str, Dict[str, Any]]:
+    return await run_mongo(
+        lambda: fetch_products(app.state.products, values_by_field, preferred, app.state.best_products, fields),
+        lambda: fetch_products_async(
+            app.state.async_products, values_by_field, preferred, app.state.async_best_products, fields
+        ),
+    )
+
+
+async def aggregate_products(pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return await run_mongo(
+        lambda: list(app.state.products.aggregate(pipeline)),
+        lambda: app.state.async_products.aggregate(pipeline).to_list(length=None),
+    )
+
+
+def snapshot_entry(field: str, value: str, variant: str) -> Optional[CachedProduct]:
+    """Full-document lookups by GTIN-14 answered from the mmap'd product snapshot."""
+    snapshot: ProductSnapshot = app.state.product_snapshot
+    if variant or field != GTIN_FIELD or snapshot.file is None:
+        return None
+    found = snapshot.get(value)
+    return CachedProduct.from_body(*found) if found is not None else None
+
+
+STALE_HEADERS = {"X-Cache-Status": "stale", "Cache-Control": "no-cache"}
+
+
+def batch_headers(stale: bool, unavailable: List[str]) -> Optional[Dict[str, str]]:
+    """Headers for a batch answered partly from stale copies or without the UPCs MongoDB could not resolve."""
+    if not unavailable:
+        return STALE_HEADERS if stale else None
+    headers = dict(STALE_HEADERS) if stale else {"Cache-Control": "no-cache"}
+    headers["Retry-After"] = str(app.state.mongo_breaker.retry_after() or 1)
+    return headers
+
+
+async def revalidate_products(
+    values_by_field: Dict[str, List[str]],
+    preferred: List[str],
+    fields: Optional[Dict[str, int]],
+    variant: str,
+    keys: Set[CacheKey],
+) -> None:
+    cache: UpcCache = app.state.upc_cache
+    try:
+        fetched = await lookup_products(values_by_field, preferred, fields)
+        for values in values_by_field.values():
+            for value in values:
+                doc = fetched.get(value)
+                cache.put((value, tuple(preferred), variant), CachedProduct(doc, variant) if doc is not None else None)
+    except (MongoUnavailable, PyMongoError) as exc:
+        # Keep serving the stale copies; the next stale hit retries
+        logger.debug("Background revalidation failed: %s", exc)
+    finally:
+        app.state.revalidating.difference_update(keys)
+
+
+def schedule_revalidation(
+    values_by_field: Dict[str, List[str]], preferred: List[str], fields: Optional[Dict[str, int]], variant: str
+) -> None:
+    """Refresh stale cache entries in a background task, at most one in flight per key."""
+    revalidating: Set[CacheKey] = app.state.revalidating
+    todo: Dict[str, List[str]] = {}
+    keys: Set[CacheKey] = set()
+    for field, values in values_by_field.items():
+        for value in values:
+            key = (value, tuple(preferred), variant)
+            if key not in revalidating:
+                todo.setdefault(field, []).append(value)
+                keys.add(key)
+    if not keys:
+        return
+    revalidating.update(keys)
+    task = asyncio.get_running_loop().create_task(revalidate_products(todo, preferred, fields, variant, keys))
+    app.state.revalidation_tasks.add(task)
+    task.add_done_callback(app.state.revalidation_tasks.discard)
+
+
+@app.exception_handler(MongoUnavailable)
+async def mongo_unavailable_handler(request: Request, exc: MongoUnavailable) -> Response:
+    retry_after = app.state.mongo_breaker.retry_after() or 1
+    return Response(
+        content=dumps_json({"detail": "Database unavailable"}),
+        status_code=503,
+        media_type="application/json",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
 @app.get("/health")
+@app.get("/health/live")
 def health() -> Dict[str, str]:
+    # Liveness: the process serves HTTP; says nothing about MongoDB
     return {"status": "ok"}
 
 
+@app.get("/health/ready")
+def health_ready() -> Response:
+    status = app.state.startup_checks.status()
+    status["breaker"] = app.state.mongo_breaker.state
+    return Response(
+        content=dumps_json(status),
+        status_code=200 if status["ready"] else 503,
+        media_type="application/json",
+    )
+
+
+def render_gauges(name: str, help_text: str, values: Dict[str, Any]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for key, value in values.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'{name}{{stat="{key}"}} {value}')
+    return lines
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    lines: List[str] = []
+    lines.extend(REQUEST_LATENCY.render())
+    lines.extend(MONGO_COMMAND_LATENCY.render())
+    lines.extend(MONGO_DOCUMENTS_RETURNED.render())
+    upc_cache = getattr(app.state, "upc_cache", None)
+    if upc_cache is not None:
+        lines.extend(render_gauges("wellaware_upc_cache", "UPC lookup cache statistics.", upc_cache.stats()))
+    mongo_breaker = getattr(app.state, "mongo_breaker", None)
+    if mongo_breaker is not None:
+        lines.extend(render_gauges("wellaware_mongo_breaker", "MongoDB circuit breaker state.", mongo_breaker.stats()))
+    product_snapshot = getattr(app.state, "product_snapshot", None)
+    if product_snapshot is not None and product_snapshot.enabled:
+        lines.extend(
+            render_gauges("wellaware_product_snapshot", "Memory-mapped product snapshot.", product_snapshot.stats())
+        )
+    upc_filter = getattr(app.state, "upc_filter", None)
+    if upc_filter is not None and upc_filter.enabled:
+        filter_stats = upc_filter.stats()
+        checks = filter_stats["checks"]
+        filter_stats["rejection_rate"] = filter_stats["rejections"] / checks if checks else 0.0
+        lines.extend(render_gauges("wellaware_upc_filter", "Unknown-barcode Bloom filter statistics.", filter_stats))
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/cache/stats")
+def cache_stats(x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+    require_admin(x_admin_token)
+    return app.state.upc_cache.stats()
+
+
+@app.post("/admin/cache/invalidate")
+def cache_invalidate(
+    upc: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(default=None),
+) -> Dict[str, Any]:
+    require_admin(x_admin_token)
+    removed = app.state.upc_cache.invalidate(lookup_key(upc)[1] if upc else None)
+    return {"invalidated": removed, "upc": upc}
+
+
+@app.get("/admin/filter/stats")
+def filter_stats(x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+    require_admin(x_admin_token)
+    return app.state.upc_filter.stats()
+
+
+@app.post("/admin/filter/refresh")
+def filter_refresh(x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+    require_admin(x_admin_token)
+    upc_filter: UpcFilter = app.state.upc_filter
+    if not upc_filter.enabled:
+        raise HTTPException(status_code=409, detail="UPC filter is disabled")
+    refreshed = upc_filter.refresh(app.state.products)
+    return {"refreshed": refreshed, **upc_filter.stats()}
+
+
+@app.get("/admin/snapshot/stats")
+def snapshot_stats(x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+    require_admin(x_admin_token)
+    return app.state.product_snapshot.stats()
+
+
+@app.post("/admin/snapshot/refresh")
+def snapshot_refresh(x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+    require_admin(x_admin_token)
+    product_snapshot: ProductSnapshot = app.state.product_snapshot
+    if not product_snapshot.enabled:
+        raise HTTPException(status_code=409, detail="Product snapshot is disabled")
+    refreshed = product_snapshot.refresh()
+    return {"refreshed": refreshed, **product_snapshot.stats()}
+
+
 @app.get("/api/products/upc/{upc_code}")
-def get_product_by_upc(upc_code: str) -> Dict[str, Any]:
-    products: Collection = app.state.products
+async def get_product_by_upc(upc_code: str, request: Request, fields: Optional[str] = None) -> Response:
     preferred: List[str] = getattr(app.state, "preferred_sources", [])
+    cache: UpcCache = app.state.upc_cache
+    variant, projection = parse_fields(fields)
+    field, value = lookup_key(upc_code)
+    key = (value, tuple(preferred), variant)
 
-    if not preferred:
-        # Simple fast path
-        doc = products.find_one({"details.upc": upc_code}, projection={"_id": 0})
-        if not doc:
+    found, entry = cache.get(key)
+    stale = False
+    if not found:
+        entry = snapshot_entry(field, value, variant)
+        if entry is not None:
+            found = True
+            cache.put(key, entry)
+    if not found:
+        # Serve the last-known-good copy now and refresh it off the request path
+        entry = cache.get_stale(key)
+        if entry is not None:
+            found = stale = True
+            schedule_revalidation({field: [value]}, preferred, projection, variant)
+    if not found and not app.state.upc_filter.might_contain(value):
+        # Definitely never loaded; skip MongoDB entirely
+        raise HTTPException(status_code=404, detail="Product not found")
+    if not found and request.headers.get("if-none-match"):
+        # Revalidation: fetch only the validator fields before the full document
+        validators = await lookup_product(field, value, preferred, VALIDATOR_FIELDS)
+        if validators is None:
+            cache.put(key, None)
             raise HTTPException(status_code=404, detail="Product not found")
-        return jsonable_encoder(doc)
+        if validators.get("contentHash"):
+            headers = validator_headers(validators, variant)
+            if is_not_modified(request, headers):
+                fmt = negotiate_format(request)
+                return Response(status_code=304, headers=representation_headers(headers, fmt, None))
+    if not found:
+        doc = await lookup_product(field, value, preferred, projection)
+        entry = CachedProduct(doc, variant) if doc is not None else None
+        cache.put(key, entry)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    fmt = negotiate_format(request)
+    body, headers = entry.representation(fmt, negotiate_coding(request))
+    if stale:
+        headers = {**headers, **STALE_HEADERS}
+    if is_not_modified(request, entry.headers):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=MEDIA_TYPES[fmt], headers=headers)
+
 
-    pipeline = [
-        {"$match": {"details.upc": upc_code}},
+@app.post("/api/products/upc/batch")
+async def get_products_by_upcs(request: UpcBatchRequest, http_request: Request) -> Response:
+    upc_codes = list(dict.fromkeys(u.strip() for u in request.upcs if u and u.strip()))
+    if len(upc_codes) > MAX_BATCH_UPCS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_UPCS} UPCs per request")
+
+    results, stale, unavailable = await resolve_upcs(upc_codes, request.fields)
+    fmt = negotiate_format(http_request)
+    return negotiated_response(
+        http_request,
+        fmt,
         {
-            "$addFields": {
-                "__rank": {
-                    "$indexOfArray": [preferred, "$source"],
-                }
-            }
+            "results": {upc: shape_product(results[upc], fmt) for upc in upc_codes},
+            "missing": [upc for upc in upc_codes if results[upc] is None and upc not in unavailable],
+            "unavailable": unavailable,
         },
+        batch_headers(stale, unavailable),
+    )
+
+
+@app.post("/api/ocr/upc")
+async def ocr_upc(
+    http_request: Request,
+    image: UploadFile = File(...),
+    lang: str = Query("eng", pattern=r"^[a-z_+]{3,40}$"),
+    psm: int = Query(6, ge=0, le=13),
+    dpi: int = Query(300, ge=70, le=1200),
+    timeout: float = Query(15, gt=0, le=60),
+    fields: Optional[str] = None,
+) -> Response:
+    pool: Optional[ProcessPoolExecutor] = app.state.ocr_pool
+    if pool is None:
+        raise HTTPException(status_code=503, detail="OCR is not available")
+    if image.content_type not in OCR_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported image format: {image.content_type}")
+    data = await image.read(OCR_MAX_IMAGE_BYTES + 1)
+    if not data:
+        raise HTTPException(status_code=400, detail="Invalid image data received")
+    if len(data) > OCR_MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB.")
+
+    future = asyncio.get_running_loop().run_in_executor(pool, ocr_image, data, lang, psm, dpi, timeout)
+    try:
+        # tesseract is killed at the same timeout inside the worker, so the process is freed too
+        text = await asyncio.wait_for(future, timeout=timeout + 1)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="OCR processing timeout")
+    # BrokenProcessPool and TesseractError subclass RuntimeError, so they must come first
+    except BrokenProcessPool:
+        await rebuild_ocr_pool(pool)
+        raise HTTPException(status_code=503, detail="OCR worker pool is not available")
+    # Decode failures are the upload's fault; UnidentifiedImageError subclasses OSError, so it comes first
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image dimensions too large")
+    except (UnidentifiedImageError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid image data received")
+    except (OSError, pytesseract.TesseractError) as exc:
+        raise HTTPException(status_code=422, detail=f"OCR failed: {exc}")
+    except RuntimeError as exc:
+        # pytesseract raises a bare RuntimeError("Tesseract process timeout") when it kills tesseract
+        if "timeout" in str(exc).lower():
+            raise HTTPException(status_code=504, detail=f"OCR processing timeout: {exc}")
+        raise HTTPException(status_code=422, detail=f"OCR failed: {exc}")
+
+    candidates = extract_upc_candidates(text)[:MAX_BATCH_UPCS]
+    results, stale, unavailable = await resolve_upcs(candidates, fields) if candidates else ({}, False, [])
+    fmt = negotiate_format(http_request)
+    return negotiated_response(
+        http_request,
+        fmt,
         {
-            "$addFields": {
-                "__rank": {"$cond": [{"$eq": ["$__rank", -1]}, 9999, "$__rank"]}
-            }
+            "text": text,
+            "candidates": candidates,
+            "results": {upc: shape_product(results[upc], fmt) for upc in candidates},
+            "missing": [upc for upc in candidates if results[upc] is None and upc not in unavailable],
+            "unavailable": unavailable,
         },
-        {"$sort": {"__rank": 1, "scrapedAt": -1}},
-        {"$limit": 1},
-        {"$project": {"_id": 0, "__rank": 0}},
+        batch_headers(stale, unavailable),
+    )
+
+
+async def resolve_upcs(
+    upc_codes: List[str], fields: Optional[str]
+) -> Tuple[Dict[str, Optional[Dict[str, Any]]], bool, List[str]]:
+    """Resolve many UPCs through the cache, snapshot and filter, then one batched MongoDB lookup.
+
+    Returns ({upc: product or None}, whether any product was served stale, UPCs
+    left unresolved because MongoDB is unavailable). Stale serving is per UPC:
+    when MongoDB is down the other UPCs are still answered, and MongoUnavailable
+    is only raised if none of them could be.
+    """
+    preferred: List[str] = getattr(app.state, "preferred_sources", [])
+    cache: UpcCache = app.state.upc_cache
+    upc_filter: UpcFilter = app.state.upc_filter
+    preferred_key = tuple(preferred)
+    variant, projection = parse_fields(fields)
+
+    keys = {upc: lookup_key(upc) for upc in upc_codes}
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    pending: Dict[str, List[str]] = {}
+    stale: Dict[str, List[str]] = {}
+    for upc in upc_codes:
+        field, value = keys[upc]
+        found, entry = cache.get((value, preferred_key, variant))
+        if not found:
+            entry = snapshot_entry(field, value, variant)
+            if entry is not None:
+                found = True
+                cache.put((value, preferred_key, variant), entry)
+        if not found:
+            entry = cache.get_stale((value, preferred_key, variant))
+            if entry is not None:
+                found = True
+                stale.setdefault(field, []).append(value)
+        if found:
+            results[upc] = entry.doc if entry is not None else None
+        elif not upc_filter.might_contain(value):
+            results[upc] = None
+        elif value not in pending.setdefault(field, []):
+            pending[field].append(value)
+
+    if stale:
+        schedule_revalidation(stale, preferred, projection, variant)
+    # Served as the cached entries' public documents, so cold and warm responses match
+    entries: Dict[str, Optional[CachedProduct]] = {}
+    unavailable: List[str] = []
+    try:
+        fetched = await lookup_products(pending, preferred, projection) if pending else {}
+    except MongoUnavailable:
+        if not results:
+            raise
+        unavailable = [upc for upc in upc_codes if upc not in results]
+    else:
+        for values in pending.values():
+            for value in values:
+                doc = fetched.get(value)
+                entries[value] = CachedProduct(doc, variant) if doc is not None else None
+                cache.put((value, preferred_key, variant), entries[value])
+    for upc in upc_codes:
+        if upc not in results:
+            entry = entries.get(keys[upc][1])
+            results[upc] = entry.doc if entry is not None else None
+    return results, bool(stale), unavailable
+
+
+@app.get("/api/products/ingredients")
+async def products_by_ingredients(
+    request: Request,
+    contains: str = Query(..., min_length=1, max_length=500),
+    excludes: Optional[str] = Query(None, max_length=500),
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    cursor: Optional[str] = None,
+) -> Response:
+    required = parse_ingredient_terms(contains)
+    if not required:
+        # $nin alone cannot use the index and would scan the whole collection
+        raise HTTPException(status_code=400, detail="contains must name at least one ingredient")
+    excluded = parse_ingredient_terms(excludes)
+    sources = [s.strip() for s in source.split(",") if s.strip()] if source else []
+    categories = [c.strip() for c in category.split(",") if c.strip()] if category else []
+    after = decode_export_cursor(cursor) if cursor else None
+    _, projection = parse_fields(fields)
+
+    query = ingredient_query(required, excluded, sources, categories, after)
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": query},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit + 1},
+        {"$project": listing_projection(projection)},
     ]
+    docs = await aggregate_products(pipeline)
 
-    results = list(products.aggregate(pipeline))
-    if not results:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return jsonable_encoder(results[0])
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_export_cursor(docs[-1]["_id"])
+    for doc in docs:
+        doc.pop("_id", None)
+    fmt = negotiate_format(request)
+    return negotiated_response(
+        request,
+        fmt,
+        {
+            "contains": required,
+            "excludes": excluded,
+            "results": [shape_product(doc, fmt) for doc in docs],
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+@app.get("/api/products/search")
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    cursor: Optional[str] = None,
+) -> Response:
+    sources = [s.strip() for s in source.split(",") if s.strip()] if source else []
+    categories = [c.strip() for c in category.split(",") if c.strip()] if category else []
+    after = decode_search_cursor(cursor) if cursor else None
+
+    docs = await aggregate_products(search_pipeline(q, sources, categories, limit, after))
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_search_cursor(docs[-1]["__score"], docs[-1]["_id"])
+
+    results = []
+    for doc in docs:
+        doc.pop("_id", None)
+        doc["score"] = doc.pop("__score")
+        results.append(doc)
+    fmt = negotiate_format(request)
+    return negotiated_response(
+        request, fmt, {"results": [shape_product(doc, fmt) for doc in results], "next_cursor": next_cursor}
+    )
+
+
+@app.get("/api/products/export")
+def export_products(
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    scraped_after: Optional[str] = None,
+    scraped_before: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(0, ge=0),
+) -> StreamingResponse:
+    sources = [s.strip() for s in source.split(",") if s.strip()] if source else []
+    categories = [c.strip() for c in category.split(",") if c.strip()] if category else []
+    after = decode_export_cursor(cursor) if cursor else None
+    _, projection = parse_fields(fields)
+    query = export_query(sources, categories, scraped_at_range(scraped_after, scraped_before), after)
+    # _id stays in the projection; export_line turns it into the resume token
+    export_projection = listing_projection(projection)
+
+    async_products = getattr(app.state, "async_products", None)
+    if async_products is not None:
+        body: Any = iter_export_async(async_products, query, export_projection, limit)
+    else:
+        body = iter_export(app.state.products, query, export_projection, limit)
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+
+def require_cnf() -> CnfIndex:
+    cnf: CnfIndex = app.state.cnf
+    if not cnf.ready:
+        raise HTTPException(status_code=503, detail="CNF database not loaded")
+    return cnf
+
+
+@app.get("/api/cnf/foods/{food_id}")
+def get_cnf_food(food_id: int) -> Response:
+    food = require_cnf().food(food_id)
+    if food is None:
+        raise HTTPException(status_code=404, detail=f"Food ID {food_id} not found")
+    return Response(content=dumps_json(food), media_type="application/json")
 
 
+@app.get("/api/cnf/search")
+def search_cnf(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(5, ge=1, le=MAX_CNF_SEARCH_LIMIT),
+) -> Response:
+    return Response(content=dumps_json(require_cnf().search(q, limit)), media_type="application/json")
@@ -0,0 +1,242 @@
+"""Key normalization and snapshot formats shared by load_data.py and app.py.
+
+The loader writes details.gtin14, details.ingredientTokens, scrapedAt and the
+Bloom/product snapshot files with these helpers, and the API parses queries and
+reads the snapshots with the same ones, so ingest and lookup cannot drift apart.
+"""
+import hashlib
+import json
+import math
+import mmap
+import re
+import struct
+import unicodedata
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def gtin_check_digit(body: str) -> int:
+    """GS1 mod-10 check digit for the given digits (without their check digit)."""
+    total = 0
+    for i, ch in enumerate(reversed(body)):
+        total += int(ch) * (3 if i % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def canonical_gtin14(code: Any) -> Optional[str]:
+    """Return the GTIN-14 form of a UPC-A/EAN-13/EAN-8/GTIN-14 code, or None.
+
+    - Spaces and hyphens are ignored; any other non-digit rejects the code
+    - Leading zeros may be missing; the result is zero-padded to 14 digits
+    - A code whose last digit is not a valid check digit is treated as missing
+      its check digit, which is computed and appended
+    - Codes shorter than 7 digits (e.g. PLUs) or all zeros return None
+    """
+    digits = str(code).replace(" ", "").replace("-", "")
+    if not digits.isdigit() or not 7 <= len(digits) <= 14 or int(digits) == 0:
+        return None
+    if len(digits) >= 8 and gtin_check_digit(digits[:-1]) == int(digits[-1]):
+        return digits.zfill(14)
+    if len(digits) <= 13:
+        # Check digit dropped by the source
+        return (digits + str(gtin_check_digit(digits))).zfill(14)
+    return None
+
+
+def canonical_gtin14_list(upcs: List[str]) -> List[str]:
+    """Canonical GTIN-14 keys for a UPC list, deduplicated and in input order."""
+    result: List[str] = []
+    for upc in upcs:
+        gtin = canonical_gtin14(upc)
+        if gtin and gtin not in result:
+            result.append(gtin)
+    return result
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Aware UTC datetime for a datetime or ISO-8601 string ("Z", any offset, or naive meaning UTC), else None."""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def canonical_scraped_at(value: Any) -> Optional[str]:
+    """scrapedAt as stored by the loader: UTC, whole seconds, "Z" ("2025-01-31T08:00:00Z"), or None.
+
+    The format has a fixed width, so MongoDB string comparisons and sorts on it
+    are chronological; mixing "Z", "+00:00" or fractional seconds would not be.
+    """
+    parsed = parse_timestamp(value)
+    if parsed is None:
+        return None
+    return parsed.replace(microsecond=0, tzinfo=None).isoformat() + "Z"
+
+
+# Fragments are split on list separators and brackets, so sub-ingredients become tokens too
+INGREDIENT_FRAGMENT_SPLIT = re.compile(r"[,;:()\[\]{}]|\.(?!\d)")
+INGREDIENT_STOPWORDS = {"and", "or", "of", "with", "from", "the", "contains", "ingredients", "may", "less", "than"}
+
+
+def normalize_ingredient_token(text: str) -> str:
+    """Lowercase, accent-folded ingredient phrase with punctuation, percentages and extra spaces removed."""
+    folded = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)).casefold()
+    folded = re.sub(r"\d+(?:[.,]\d+)?\s*%", " ", folded)
+    folded = re.sub(r"[^\w\s-]|_", " ", folded)
+    return " ".join(folded.replace("-", " ").split())
+
+
+def ingredient_tokens(ingredients: List[str]) -> List[str]:
+    """Sorted, deduplicated ingredient phrases plus their significant words.
+
+    "Enriched Wheat Flour (niacin, Riboflavine)" yields "enriched wheat flour",
+    "niacin", "riboflavine", "enriched", "wheat" and "flour", so both exact
+    ingredients and allergen words ("wheat") can be matched with $all/$nin.
+    """
+    tokens = set()
+    for entry in ingredients:
+        for fragment in INGREDIENT_FRAGMENT_SPLIT.split(entry):
+            phrase = normalize_ingredient_token(fragment)
+            if phrase.startswith("contains "):
+                phrase = phrase[len("contains ") :]
+            if len(phrase) < 2 or phrase in INGREDIENT_STOPWORDS:
+                continue
+            tokens.add(phrase)
+            tokens.update(
+                w for w in phrase.split() if len(w) >= 3 and not w.isdigit() and w not in INGREDIENT_STOPWORDS
+            )
+    return sorted(tokens)
+
+
+BLOOM_MAGIC = b"WABLOOM1"
+BLOOM_HEADER = struct.Struct("<QQQ")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over lookup keys (GTIN-14 and raw UPC strings).
+
+    Uses double hashing over a 128-bit blake2b digest. Snapshot layout
+    (little-endian): BLOOM_MAGIC, BLOOM_HEADER (num_bits, num_hashes, count),
+    then the bit array.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytearray] = None, count: int = 0) -> None:
+        self.num_bits = max(8, num_bits)
+        self.num_hashes = max(1, num_hashes)
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float) -> "BloomFilter":
+        capacity = max(1, capacity)
+        num_bits = int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        num_hashes = int(round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        if not data.startswith(BLOOM_MAGIC):
+            raise ValueError("Not a WellAware Bloom filter snapshot")
+        num_bits, num_hashes, count = BLOOM_HEADER.unpack_from(data, len(BLOOM_MAGIC))
+        bits = bytearray(data[len(BLOOM_MAGIC) + BLOOM_HEADER.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated Bloom filter snapshot")
+        return cls(num_bits, num_hashes, bits, count)
+
+    def to_bytes(self) -> bytes:
+        return BLOOM_MAGIC + BLOOM_HEADER.pack(self.num_bits, self.num_hashes, self.count) + bytes(self.bits)
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    @property
+    def estimated_fp_rate(self) -> float:
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+SNAPSHOT_MAGIC = b"WASNAP03"
+SNAPSHOT_HEADER = struct.Struct("<QQ")  # entry count, metadata length
+# GTIN-14 key, blob offset, scrapedAt length, body length, contentHash digest
+SNAPSHOT_ENTRY = struct.Struct("<14sQII32s")
+
+
+def snapshot_digest(content_hash: Any) -> bytes:
+    """Raw SHA-256 of a contentHash for a SNAPSHOT_ENTRY; all zeros when the document has none."""
+    try:
+        digest = bytes.fromhex(content_hash) if isinstance(content_hash, str) else b""
+    except ValueError:
+        digest = b""
+    return digest if len(digest) == 32 else b""
+
+
+class ProductSnapshotFile:
+    """Read-only view of a load_data.py --product-snapshot file.
+
+    Layout (little-endian): SNAPSHOT_MAGIC, SNAPSHOT_HEADER, metadata JSON, one
+    SNAPSHOT_ENTRY per key sorted by key, then the product blobs. Each blob is
+    str(scrapedAt) (empty when missing) followed by the JSON body. The file is
+    memory-mapped, so every worker shares one copy through the OS page cache.
+    Lookups binary-search the sorted fixed-width key index and return the
+    product's pre-encoded public JSON with its contentHash and scrapedAt, so
+    validators are available without decoding the body.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a product snapshot")
+        self.count, meta_len = SNAPSHOT_HEADER.unpack_from(self._mm, len(SNAPSHOT_MAGIC))
+        meta_offset = len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+        self.meta: Dict[str, Any] = json.loads(self._mm[meta_offset : meta_offset + meta_len])
+        self._index_offset = meta_offset + meta_len
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._mm)
+
+    def get(self, gtin14: str) -> Optional[Tuple[bytes, Optional[str], Optional[str]]]:
+        if len(gtin14) != 14:
+            return None
+        target = gtin14.encode("ascii", "replace")
+        mm, base, width = self._mm, self._index_offset, SNAPSHOT_ENTRY.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = base + mid * width
+            if mm[pos : pos + 14] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count:
+            return None
+        key, offset, scraped_len, length, digest = SNAPSHOT_ENTRY.unpack_from(mm, base + lo * width)
+        if key != target:
+            return None
+        body_offset = offset + scraped_len
+        scraped_at = mm[offset:body_offset].decode("utf-8") if scraped_len else None
+        return mm[body_offset : body_offset + length], digest.hex() if any(digest) else None, scraped_at
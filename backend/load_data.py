@@ -1,13 +1,28 @@
 import argparse
 import gzip
+import hashlib
 import json
 import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from pymongo import MongoClient, ReplaceOne
+from pymongo import MongoClient, ReplaceOne, UpdateOne
 from pymongo.collection import Collection
-from pymongo.errors import ConfigurationError
+from pymongo.errors import BulkWriteError, ConfigurationError, PyMongoError
+
+from catalog_format import (
+    SNAPSHOT_ENTRY,
+    SNAPSHOT_HEADER,
+    SNAPSHOT_MAGIC,
+    BloomFilter,
+    canonical_gtin14_list,
+    canonical_scraped_at,
+    ingredient_tokens,
+    snapshot_digest,
+)
 
 try:
     from dotenv import load_dotenv  # type: ignore
@@ -15,6 +30,12 @@ try:
 except Exception:
     pass
 
+try:
+    import orjson  # type: ignore
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 
 def get_mongo_client(connection_uri: str) -> MongoClient:
     """Create and return a MongoClient with a short server selection timeout."""
@@ -39,6 +60,17 @@ def ensure_indexes(collection: Collection) -> None:
     """Create idempotent indexes required by the application."""
     # Multikey index for UPC lookups
     collection.create_index("details.upc", name="idx_details_upc")
+    # Canonical GTIN-14 keys so UPC-A/EAN/GTIN variants match with one equality lookup
+    collection.create_index("details.gtin14", name="idx_details_gtin14")
+    # Weighted text index for name/brand/category search in the API
+    collection.create_index(
+        [("productName", "text"), ("brand", "text"), ("category", "text")],
+        weights={"productName": 10, "brand": 5, "category": 2},
+        default_language="none",
+        name="idx_product_text",
+    )
+    # Ingredient contains/excludes queries in the API; _id lets a page be read in cursor order from the index
+    collection.create_index([("details.ingredientTokens", 1), ("_id", 1)], name="idx_ingredient_tokens_id")
     # Compound index for source + article number merges
     collection.create_index(
         [("source", 1), ("details.articleNumber", 1)],
@@ -80,9 +112,12 @@ def normalize_product_document(doc: Dict[str, Any]) -> Dict[str, Any]:
 
     Ensures:
     - details.upc is a list[str] (multikey), preserving leading zeros already present
+    - details.gtin14 is the list of canonical GTIN-14 keys derived from details.upc
     - category is a list[str]
     - details.ingredients is a list[str]
+    - details.ingredientTokens is the normalized token list derived from it
     - details.articleNumber exists as str if present
+    - scrapedAt strings are rewritten to the canonical UTC form (unparseable ones are kept)
     - Removes any existing _id to avoid replacement conflicts
     """
     # Do not carry forward an _id coming from source files
@@ -98,10 +133,12 @@ def normalize_product_document(doc: Dict[str, Any]) -> Dict[str, Any]:
     upc_raw = details.get("upc")
     upc_list = _normalize_to_string_list(upc_raw)
     details["upc"] = upc_list
+    details["gtin14"] = canonical_gtin14_list(upc_list)
 
     # Normalize ingredients under details
     ingredients_raw = details.get("ingredients")
     details["ingredients"] = _normalize_to_string_list(ingredients_raw)
+    details["ingredientTokens"] = ingredient_tokens(details["ingredients"])
 
     # Normalize articleNumber to a string when present
     if "articleNumber" in details and details["articleNumber"] is not None:
@@ -111,6 +148,10 @@ def normalize_product_document(doc: Dict[str, Any]) -> Dict[str, Any]:
     # Normalize top-level arrays
     doc["category"] = _normalize_to_string_list(doc.get("category"))
 
+    # One fixed-width UTC format, so string range filters and sorts on scrapedAt are chronological
+    if isinstance(doc.get("scrapedAt"), str):
+        doc["scrapedAt"] = canonical_scraped_at(doc["scrapedAt"]) or doc["scrapedAt"]
+
     return doc
 
 
@@ -128,6 +169,20 @@ def apply_drop_fields(doc: Dict[str, Any], drop_fields: List[str]) -> None:
                 current = current.get(key)
 
 
+CONTENT_HASH_EXCLUDED_FIELDS = ("scrapedAt", "lastSeen", "contentHash")
+
+
+def compute_content_hash(doc: Dict[str, Any]) -> str:
+    """Stable SHA-256 of a normalized document, ignoring volatile fields like scrapedAt.
+
+    The API derives strong ETags from this hash, so it must only change when
+    the stored content changes.
+    """
+    stable = {k: v for k, v in doc.items() if k not in CONTENT_HASH_EXCLUDED_FIELDS}
+    payload = json.dumps(stable, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def derive_upsert_filter(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Derive the upsert filter according to priority rules.
 
@@ -157,21 +212,361 @@ def derive_upsert_filter(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     return None
 
 
+def best_products_pipeline(
+    prefer_sources: List[str], best_collection: str, upcs: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Aggregation that ranks documents per UPC and $merges the winner into best_collection.
+
+    Ranking matches the API: preferred source order first, then most recent scrapedAt.
+    Each output document is the winning product with _id set to the canonical
+    GTIN-14 and rankedBy/rankedAt metadata so the API can tell which ordering
+    produced it. When upcs (GTIN-14 keys) is given only those are rebuilt.
+    """
+    match: Dict[str, Any] = (
+        {"details.gtin14": {"$in": upcs}} if upcs is not None else {"details.gtin14.0": {"$exists": True}}
+    )
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        {"$addFields": {"__upc": "$details.gtin14"}},
+        {"$unwind": "$__upc"},
+    ]
+    if upcs is not None:
+        pipeline.append({"$match": {"__upc": {"$in": upcs}}})
+    pipeline.extend(
+        [
+            {"$addFields": {"__rank": {"$indexOfArray": [prefer_sources, "$source"]}}},
+            {"$addFields": {"__rank": {"$cond": [{"$eq": ["$__rank", -1]}, 9999, "$__rank"]}}},
+            {"$sort": {"__upc": 1, "__rank": 1, "scrapedAt": -1}},
+            {"$group": {"_id": "$__upc", "doc": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$doc"}},
+            {
+                "$addFields": {
+                    "_id": "$__upc",
+                    "rankedBy": ",".join(prefer_sources),
+                    "rankedAt": datetime.now(timezone.utc),
+                }
+            },
+            {"$project": {"__upc": 0, "__rank": 0}},
+            {"$merge": {"into": best_collection, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+    )
+    return pipeline
+
+
+def refresh_best_products(
+    collection: Collection, best_collection: str, prefer_sources: List[str], upcs: Iterable[str]
+) -> int:
+    """Recompute the best document for the given GTIN-14 keys. Returns the number refreshed."""
+    upc_list = sorted(set(upcs))
+    if not upc_list:
+        return 0
+    # Drop entries first so UPCs that no longer match any document disappear
+    collection.database[best_collection].delete_many({"_id": {"$in": upc_list}})
+    list(collection.aggregate(best_products_pipeline(prefer_sources, best_collection, upc_list)))
+    return len(upc_list)
+
+
+def rebuild_best_products(collection: Collection, best_collection: str, prefer_sources: List[str]) -> int:
+    """Rebuild the whole best-per-UPC collection in place without blocking readers.
+
+    $merge replaces entries one by one, so the API keeps serving during the
+    rebuild; entries not touched by this run are removed afterwards.
+    """
+    started_at = datetime.now(timezone.utc)
+    list(collection.aggregate(best_products_pipeline(prefer_sources, best_collection), allowDiskUse=True))
+    collection.database[best_collection].delete_many({"rankedAt": {"$lt": started_at}})
+    return collection.database[best_collection].estimated_document_count()
+
+
+def write_bloom_snapshot(collection: Collection, path: Path, fp_rate: float) -> Dict[str, Any]:
+    """Write a Bloom filter over every details.upc and details.gtin14 value in the collection.
+
+    The API loads this file (UPC_BLOOM_FILTER=<path>) to answer "definitely absent"
+    without querying MongoDB; both sides use BloomFilter from catalog_format.py.
+    The file is written to a temporary path and renamed into place so readers
+    never see a partial snapshot.
+    """
+    capacity = max(1, int(collection.estimated_document_count() * 2.5) + 1000)
+    bloom = BloomFilter.for_capacity(capacity, fp_rate)
+
+    cursor = collection.find({}, projection={"_id": 0, "details.upc": 1, "details.gtin14": 1}, batch_size=10000)
+    for doc in cursor:
+        details = doc.get("details") or {}
+        for key in set(details.get("upc") or []) | set(details.get("gtin14") or []):
+            bloom.add(key)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(bloom.to_bytes())
+    os.replace(tmp_path, path)
+    return {"path": str(path), "keys": bloom.count, "memory_bytes": bloom.memory_bytes}
+
+
+def snapshot_json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def write_product_snapshot(collection: Collection, path: Path, prefer_sources: List[str]) -> Dict[str, Any]:
+    """Write an immutable GTIN-14 -> product JSON snapshot for the API to mmap.
+
+    Layout (little-endian): SNAPSHOT_MAGIC, SNAPSHOT_HEADER, metadata JSON
+    ({"rankedBy", "createdAt"}), one SNAPSHOT_ENTRY per key sorted by key, then
+    the product blobs (offsets are absolute). Each blob is str(scrapedAt), which
+    the API uses for validators without decoding the body, followed by the
+    response body: the document without contentHash (kept in the entry for
+    ETags), lastSeen, details.gtin14 and details.ingredientTokens. Each key maps to the product the
+    API would pick: lowest index in prefer_sources, then newest scrapedAt. A
+    product listed under several keys is stored once. The API reads it with
+    ProductSnapshotFile from catalog_format.py; the file is renamed into place when complete.
+    """
+    rank_of = {source: i for i, source in enumerate(prefer_sources)}
+    winners: Dict[str, Tuple[int, str, Any]] = {}
+    cursor = collection.find(
+        {"details.gtin14": {"$exists": True}},
+        projection={"source": 1, "scrapedAt": 1, "details.gtin14": 1},
+        batch_size=10000,
+    )
+    for doc in cursor:
+        rank = rank_of.get(doc.get("source"), 9999)
+        scraped_at = str(doc.get("scrapedAt") or "")
+        for key in set((doc.get("details") or {}).get("gtin14") or []):
+            if not isinstance(key, str) or len(key) != 14 or not key.isdigit():
+                continue
+            current = winners.get(key)
+            if current is None or rank < current[0] or (rank == current[0] and scraped_at > current[1]):
+                winners[key] = (rank, scraped_at, doc["_id"])
+
+    keys_by_id: Dict[Any, List[str]] = {}
+    for key, (_, _, doc_id) in winners.items():
+        keys_by_id.setdefault(doc_id, []).append(key)
+
+    meta = json.dumps({"rankedBy": prefer_sources, "createdAt": datetime.now(timezone.utc).isoformat()}).encode("utf-8")
+    index_offset = len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size + len(meta)
+    blob_offset = index_offset + SNAPSHOT_ENTRY.size * len(winners)
+    locations: Dict[str, Tuple[int, int, int, bytes]] = {}
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(SNAPSHOT_HEADER.pack(len(winners), len(meta)))
+        f.write(meta)
+        f.seek(blob_offset)
+        ids = list(keys_by_id)
+        for start in range(0, len(ids), 1000):
+            for doc in collection.find({"_id": {"$in": ids[start : start + 1000]}}):
+                doc_id = doc.pop("_id")
+                digest = snapshot_digest(doc.pop("contentHash", None))
+                doc.pop("lastSeen", None)
+                details = doc.get("details")
+                if isinstance(details, dict):
+                    details.pop("gtin14", None)
+                    details.pop("ingredientTokens", None)
+                # Same text the API's ETag basis formats from a MongoDB-served scrapedAt
+                scraped_at = doc.get("scrapedAt")
+                scraped = str(scraped_at).encode("utf-8") if scraped_at is not None else b""
+                blob = json.dumps(
+                    doc, ensure_ascii=False, separators=(",", ":"), default=snapshot_json_default
+                ).encode("utf-8")
+                for key in keys_by_id[doc_id]:
+                    locations[key] = (blob_offset, len(scraped), len(blob), digest)
+                f.write(scraped)
+                f.write(blob)
+                blob_offset += len(scraped) + len(blob)
+        f.seek(index_offset)
+        for key in sorted(locations):
+            f.write(SNAPSHOT_ENTRY.pack(key.encode("ascii"), *locations[key]))
+    if len(locations) != len(winners):
+        # A winning document was deleted between the two passes; the header count would be wrong
+        tmp_path.unlink()
+        raise RuntimeError("Products changed while writing the snapshot; re-run --product-snapshot")
+    os.replace(tmp_path, path)
+    return {"path": str(path), "keys": len(locations), "products": len(keys_by_id), "bytes": blob_offset}
+
+
+def open_jsonl(path: Path) -> Any:
+    """Open a .jsonl or .jsonl.gz file for binary reading."""
+    return gzip.open(path, "rb") if str(path).endswith(".gz") else open(path, "rb")
+
+
+def parse_jsonl_line(raw: bytes) -> Optional[Dict[str, Any]]:
+    """JSON object on one raw line, or None for blank, malformed or non-object lines."""
+    line = raw.decode("utf-8", errors="ignore").strip()
+    if not line:
+        return None
+    try:
+        obj = json_loads(line)
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def iter_jsonl_lines(path: Path, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset after the line, raw line) for the lines that start in [start, end).
+
+    Offsets in a .jsonl.gz file are positions in the decompressed stream, so
+    seeking to one re-reads the file up to it. end=None reads to the end.
+    """
+    with open_jsonl(path) as f:
+        if start > 0:
+            # Skip the line in progress; it belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        while end is None or f.tell() < end:
+            raw = f.readline()
+            if not raw:
+                break
+            yield f.tell(), raw
+
+
+def iter_jsonl_range(path: Path, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (offset after the line, JSON object) for the lines that start in [start, end)."""
+    for offset, raw in iter_jsonl_lines(path, start, end):
+        obj = parse_jsonl_line(raw)
+        if obj is not None:
+            yield offset, obj
+
+
 def iter_jsonl_records(path: Path) -> Iterable[Dict[str, Any]]:
     """Yield JSON objects from a .jsonl or .jsonl.gz file, one per line."""
-    open_func = gzip.open if path.suffix == ".gz" or str(path).endswith(".jsonl.gz") else open
-    mode = "rt"
-    with open_func(path, mode, encoding="utf-8", errors="ignore") as f:  # type: ignore[arg-type]
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-            if isinstance(obj, dict):
-                yield obj
+    for _, obj in iter_jsonl_range(path):
+        yield obj
+
+
+PreparedRecord = Optional[Tuple[Dict[str, Any], Dict[str, Any]]]
+
+
+def prepare_record(raw_doc: Dict[str, Any], drop_fields: List[str]) -> PreparedRecord:
+    """Normalize one input record into (upsert filter, document); None when it has no upsert key."""
+    doc = normalize_product_document(raw_doc)
+    if drop_fields:
+        apply_drop_fields(doc, drop_fields)
+    doc["contentHash"] = compute_content_hash(doc)
+    filt = derive_upsert_filter(doc)
+    if not filt:
+        return None
+    return filt, doc
+
+
+def plan_byte_ranges(path: Path, start: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """Split an uncompressed .jsonl file into (start, end) byte ranges of chunk_bytes, from start on."""
+    size = path.stat().st_size
+    return [(chunk_start, min(chunk_start + chunk_bytes, size)) for chunk_start in range(start, size, chunk_bytes)]
+
+
+def iter_line_batches(path: Path, start: int, chunk_bytes: int) -> Iterator[List[Tuple[int, bytes]]]:
+    """Raw (offset, line) lists of about chunk_bytes each.
+
+    Used for .jsonl.gz files, which cannot be split by seeking.
+    """
+    batch: List[Tuple[int, bytes]] = []
+    batch_bytes = 0
+    for offset, raw in iter_jsonl_lines(path, start):
+        batch.append((offset, raw))
+        batch_bytes += len(raw)
+        if batch_bytes >= chunk_bytes:
+            yield batch
+            batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+
+def prepare_chunk(path: Path, start: int, end: int, drop_fields: List[str]) -> List[Tuple[int, PreparedRecord]]:
+    """Parse and normalize one byte range of a .jsonl file; runs in a --workers pool process."""
+    return [(offset, prepare_record(raw_doc, drop_fields)) for offset, raw_doc in iter_jsonl_range(path, start, end)]
+
+
+def prepare_lines(lines: List[Tuple[int, bytes]], drop_fields: List[str]) -> List[Tuple[int, PreparedRecord]]:
+    """Parse and normalize raw lines read by the parent process; runs in a --workers pool process."""
+    prepared: List[Tuple[int, PreparedRecord]] = []
+    for offset, raw in lines:
+        raw_doc = parse_jsonl_line(raw)
+        if raw_doc is not None:
+            prepared.append((offset, prepare_record(raw_doc, drop_fields)))
+    return prepared
+
+
+def iter_prepared_records(
+    files: List[Path],
+    drop_fields: List[str],
+    workers: int,
+    chunk_bytes: int,
+    start_offsets: Optional[Dict[Path, int]] = None,
+) -> Iterator[Tuple[Path, int, PreparedRecord]]:
+    """(path, offset after the record, prepared record) in input order, parsed in-process or by `workers` processes.
+
+    Uncompressed files are split into byte ranges each worker reads itself;
+    .jsonl.gz files are decompressed here and handed out as line batches of the
+    same size. Files listed in start_offsets are read from that offset (see
+    iter_jsonl_lines). At most two units per worker are in flight, so memory
+    stays bounded when MongoDB writes are slower than parsing.
+    """
+    start_offsets = start_offsets or {}
+    if workers <= 1:
+        for file_path in files:
+            for offset, raw_doc in iter_jsonl_range(file_path, start_offsets.get(file_path, 0)):
+                yield file_path, offset, prepare_record(raw_doc, drop_fields)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def submit_units() -> Iterator[Tuple[Path, Any]]:
+            for path in files:
+                start = start_offsets.get(path, 0)
+                if str(path).endswith(".gz"):
+                    for lines in iter_line_batches(path, start, chunk_bytes):
+                        yield path, pool.submit(prepare_lines, lines, drop_fields)
+                else:
+                    for chunk_start, end in plan_byte_ranges(path, start, chunk_bytes):
+                        yield path, pool.submit(prepare_chunk, path, chunk_start, end, drop_fields)
+
+        pending: Deque[Tuple[Path, Any]] = deque()
+        for unit in submit_units():
+            pending.append(unit)
+            if len(pending) >= workers * 2:
+                chunk_path, future = pending.popleft()
+                for offset, prepared in future.result():
+                    yield chunk_path, offset, prepared
+        while pending:
+            chunk_path, future = pending.popleft()
+            for offset, prepared in future.result():
+                yield chunk_path, offset, prepared
+
+
+def read_checkpoint(path: Path, files: List[Path]) -> Tuple[List[Path], Dict[Path, int]]:
+    """Remaining input for --resume: the files from the checkpointed one on, and its start offset.
+
+    A missing checkpoint file means nothing was acknowledged yet, so all files remain.
+    """
+    if not path.exists():
+        return files, {}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    by_name = {str(file_path): i for i, file_path in enumerate(files)}
+    if manifest.get("file") not in by_name:
+        raise SystemExit(f"Checkpoint {path} refers to {manifest.get('file')!r}, which is not among the input files.")
+    index = by_name[manifest["file"]]
+    return files[index:], {files[index]: int(manifest["offset"])}
+
+
+def write_checkpoint(path: Path, file_path: Path, offset: int) -> None:
+    """Durably record that every record up to offset in file_path (and in the files before it) is written.
+
+    The manifest is fsynced under a temporary name and renamed into place, so a
+    crash leaves either the previous or the new checkpoint.
+    """
+    manifest = {
+        "file": str(file_path),
+        "offset": offset,
+        "updatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 
 def collect_input_files(data_dir: Path) -> List[Path]:
@@ -182,6 +577,131 @@ def collect_input_files(data_dir: Path) -> List[Path]:
     return files
 
 
+def _upsert_filter_key(filt: Dict[str, Any]) -> Tuple[Any, ...]:
+    if "details.articleNumber" in filt:
+        return ("article", filt["source"], filt["details.articleNumber"])
+    if "details.upc" in filt:
+        return ("upc", filt["details.upc"])
+    return ("url", filt["productUrl"])
+
+
+def _existing_doc_keys(doc: Dict[str, Any]) -> List[Tuple[Any, ...]]:
+    """Keys of every upsert filter (see derive_upsert_filter) this stored document matches."""
+    details = doc.get("details") or {}
+    keys: List[Tuple[Any, ...]] = []
+    article_numbers = details.get("articleNumber")
+    for article_number in article_numbers if isinstance(article_numbers, list) else [article_numbers]:
+        if isinstance(article_number, str):
+            keys.append(("article", doc.get("source"), article_number))
+    upcs = details.get("upc")
+    for upc in upcs if isinstance(upcs, list) else [upcs]:
+        if isinstance(upc, str):
+            keys.append(("upc", upc))
+    if isinstance(doc.get("productUrl"), str):
+        keys.append(("url", doc["productUrl"]))
+    return keys
+
+
+def find_existing_docs(
+    collection: Collection, filters: List[Dict[str, Any]], fields: List[str]
+) -> List[Optional[Dict[str, Any]]]:
+    """Stored document each upsert filter matches (None if none), projected to fields, aligned with filters.
+
+    Replaces one find_one(filt, projection={"source": 1}) per document with one
+    $in query per filter kind (and per source for article numbers), so each
+    query still uses its own index. A returned document is only registered under
+    keys of the kind its query serves, so when several documents match a filter,
+    the first one its own query returns wins, as with find_one.
+    """
+    articles: Dict[Any, List[str]] = {}
+    upcs: List[str] = []
+    urls: List[str] = []
+    for filt in filters:
+        key = _upsert_filter_key(filt)
+        if key[0] == "article":
+            articles.setdefault(key[1], []).append(key[2])
+        elif key[0] == "upc":
+            upcs.append(key[1])
+        else:
+            urls.append(key[1])
+
+    queries: List[Tuple[str, Dict[str, Any]]] = [
+        ("article", {"source": source, "details.articleNumber": {"$in": list(set(numbers))}})
+        for source, numbers in articles.items()
+    ]
+    if upcs:
+        queries.append(("upc", {"details.upc": {"$in": list(set(upcs))}}))
+    if urls:
+        queries.append(("url", {"productUrl": {"$in": list(set(urls))}}))
+
+    projection = {"source": 1, "details.articleNumber": 1, "details.upc": 1, "productUrl": 1}
+    projection.update({field: 1 for field in fields})
+    doc_by_key: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for kind, query in queries:
+        for doc in collection.find(query, projection=projection):
+            for key in _existing_doc_keys(doc):
+                if key[0] == kind:
+                    doc_by_key.setdefault(key, doc)
+    return [doc_by_key.get(_upsert_filter_key(filt)) for filt in filters]
+
+
+def find_existing_sources(collection: Collection, filters: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Source of the stored document each upsert filter matches (None if none), aligned with filters."""
+    return [doc.get("source") if doc else None for doc in find_existing_docs(collection, filters, ["source"])]
+
+
+def changed_operations(
+    collection: Collection,
+    batch: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+    last_seen_at: Optional[datetime] = None,
+) -> Tuple[List[Any], int]:
+    """Bulk operations for a batch of (filter, document) pairs, leaving out unchanged documents.
+
+    Stored contentHash values are fetched with one lookup for the whole batch. A
+    document is only left out when no earlier document in the batch writes the
+    same key, so the end state matches replacing every document. With
+    last_seen_at, unchanged documents get a lastSeen update instead.
+
+    Returns (operations, unchanged_count).
+    """
+    stored_docs = find_existing_docs(collection, [filt for filt, _ in batch], ["contentHash"])
+    written_keys: Set[Tuple[Any, ...]] = set()
+    operations: List[Any] = []
+    unchanged = 0
+    for (filt, doc), stored in zip(batch, stored_docs):
+        key = _upsert_filter_key(filt)
+        if stored is not None and stored.get("contentHash") == doc["contentHash"] and key not in written_keys:
+            unchanged += 1
+            if last_seen_at is not None:
+                operations.append(UpdateOne(filt, {"$set": {"lastSeen": last_seen_at}}))
+            continue
+        written_keys.add(key)
+        written_keys.update(_existing_doc_keys(doc))
+        operations.append(ReplaceOne(filt, doc, upsert=True))
+    return operations, unchanged
+
+
+def report_batch_error(batch_number: int, batch_size: int, failed: int, exc: PyMongoError) -> None:
+    """Print one JSON line describing a failed (or partially failed) bulk write."""
+    details = getattr(exc, "details", None) or {}
+    write_errors = details.get("writeErrors") or []
+    message = write_errors[0].get("errmsg") if write_errors else str(exc)
+    print(
+        json.dumps(
+            {
+                "status": "batch_error",
+                "batch": batch_number,
+                "batch_size": batch_size,
+                "failed": failed,
+                "write_concern_errors": len(details.get("writeConcernErrors") or []),
+                "error": message,
+            },
+            ensure_ascii=False,
+        ),
+        flush=True,
+    )
+
+
 def process_files(
     files: List[Path],
     collection: Collection,
@@ -189,25 +709,123 @@ def process_files(
     progress_every: int,
     drop_fields: List[str],
     prefer_sources: List[str],
-) -> Tuple[int, int, int, int]:
+    best_collection: Optional[str] = None,
+    workers: int = 0,
+    chunk_bytes: int = 64 * 1024 * 1024,
+    write_concurrency: int = 1,
+    skip_unchanged: bool = False,
+    last_seen: bool = False,
+    start_offsets: Optional[Dict[Path, int]] = None,
+    checkpoint_path: Optional[Path] = None,
+) -> Tuple[int, int, int, int, int, int]:
     """Process input files and perform unordered bulk upserts.
 
-    Returns a tuple: (processed_docs, upserted_count, modified_count, skipped_count)
+    With workers > 1, parsing and normalization run in a process pool (see
+    iter_prepared_records); writes stay in input order. With write_concurrency > 1,
+    up to that many batches are written by a thread pool while parsing continues;
+    submitting blocks once the pool is full. Batches that share an upsert key are
+    still written one after another, and precedence lookups wait for in-flight
+    batches writing the keys they look up, so results match a serial load.
+    When best_collection is set, the best-per-UPC entries for every UPC written
+    in a batch are refreshed right after that batch is acknowledged.
+
+    With skip_unchanged, documents whose stored contentHash matches are not
+    rewritten (see changed_operations). With last_seen, written documents carry
+    lastSeen = load start time, and unchanged ones get only that field updated.
+    A failed batch is reported and counted; the load continues.
+
+    With checkpoint_path, the input position a batch ends at is written there
+    (see write_checkpoint) once that batch and every batch before it are
+    acknowledged. A failed batch stops the checkpoint for the rest of the run,
+    so a resumed load retries it. start_offsets resumes files mid-way.
+
+    Returns a tuple:
+    (processed_docs, upserted_count, modified_count, skipped_count, failed_count, unchanged_count)
     """
-    operations: List[ReplaceOne] = []
+    operations: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    # With prefer_sources, documents wait here until one lookup decides precedence for all of them
+    candidates: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    touched_upcs: List[str] = []
+    # Upsert keys written by the current batch; only tracked when batches run concurrently
+    batch_keys: Set[Tuple[Any, ...]] = set()
     processed_docs = 0
     upserted_total = 0
     modified_total = 0
     skipped_total = 0
+    failed_total = 0
+    unchanged_total = 0
+    batches_written = 0
+    last_seen_at = datetime.now(timezone.utc) if last_seen else None
+    # Input position of the last record read
+    position: Optional[Tuple[Path, int]] = None
+    # Submitted batches not yet covered by the checkpoint, in input order, with the position each ends at
+    uncheckpointed: Deque[Tuple[int, Tuple[Path, int]]] = deque()
+    acknowledged: Set[int] = set()
+    checkpoint_stopped = False
 
-    def flush_ops() -> Tuple[int, int]:
-        nonlocal operations
-        if not operations:
-            return 0, 0
-        result = collection.bulk_write(operations, ordered=False)
-        upserted = result.upserted_count or 0
-        modified = result.modified_count or 0
-        operations = []
+    writer = ThreadPoolExecutor(max_workers=write_concurrency) if write_concurrency > 1 else None
+    # In-flight batches, oldest first, with the upsert keys each one writes
+    pending: Deque[Tuple[int, Future, Set[Tuple[Any, ...]]]] = deque()
+
+    def write_batch(
+        batch_number: int, batch: List[Tuple[Dict[str, Any], Dict[str, Any]]], batch_upcs: List[str]
+    ) -> Tuple[int, int, int, int, bool]:
+        # Runs on a writer thread when write_concurrency > 1.
+        # Returns (upserted, modified, failed, unchanged, durable); durable is False unless the
+        # whole batch was acknowledged at the requested write concern.
+        upserted, modified, failed, unchanged = 0, 0, 0, 0
+        durable = True
+        try:
+            if skip_unchanged:
+                requests, unchanged = changed_operations(collection, batch, last_seen_at)
+            else:
+                requests = [ReplaceOne(filt, doc, upsert=True) for filt, doc in batch]
+            if requests:
+                result = collection.bulk_write(requests, ordered=False)
+                upserted, modified = result.upserted_count or 0, result.modified_count or 0
+        except BulkWriteError as exc:
+            details = exc.details or {}
+            upserted = details.get("nUpserted", 0)
+            modified = details.get("nModified", 0)
+            failed = len(details.get("writeErrors") or [])
+            durable = False
+            report_batch_error(batch_number, len(batch), failed, exc)
+        except PyMongoError as exc:
+            upserted, modified, failed = 0, 0, len(batch) - unchanged
+            durable = False
+            report_batch_error(batch_number, len(batch), failed, exc)
+        if best_collection and failed + unchanged < len(batch):
+            try:
+                refresh_best_products(collection, best_collection, prefer_sources, batch_upcs)
+            except PyMongoError as exc:
+                report_batch_error(batch_number, len(batch), 0, exc)
+        return upserted, modified, failed, unchanged, durable
+
+    def advance_checkpoint(batch_number: int, succeeded: bool) -> None:
+        nonlocal checkpoint_stopped
+        if checkpoint_path is None or checkpoint_stopped:
+            return
+        if not succeeded:
+            checkpoint_stopped = True
+            return
+        acknowledged.add(batch_number)
+        durable: Optional[Tuple[Path, int]] = None
+        # Batches may be acknowledged out of order; only move past a contiguous acknowledged prefix
+        while uncheckpointed and uncheckpointed[0][0] in acknowledged:
+            number, durable = uncheckpointed.popleft()
+            acknowledged.discard(number)
+        if durable is not None:
+            write_checkpoint(checkpoint_path, *durable)
+
+    def record_batch(batch_number: int, counts: Tuple[int, int, int, int, bool]) -> None:
+        nonlocal upserted_total, modified_total, failed_total, unchanged_total
+        upserted, modified, failed, unchanged, durable = counts
+        upserted_total += upserted
+        modified_total += modified
+        failed_total += failed
+        unchanged_total += unchanged
+        # A BulkWriteError with only writeConcernErrors has no failed writes but is not acknowledged
+        advance_checkpoint(batch_number, durable)
         # Progress after each flush
         if progress_every and processed_docs % progress_every != 0:
             try:
@@ -215,8 +833,8 @@ def process_files(
                     json.dumps(
                         {
                             "progress": processed_docs,
-                            "upserted_so_far": upserted_total + upserted,
-                            "modified_so_far": modified_total + modified,
+                            "upserted_so_far": upserted_total,
+                            "modified_so_far": modified_total,
                             "skipped_so_far": skipped_total,
                             "status": "flushed",
                         }
@@ -225,61 +843,117 @@ def process_files(
                 )
             except Exception:
                 pass
-        return upserted, modified
-
-    for file_path in files:
-        for raw_doc in iter_jsonl_records(file_path):
-            doc = normalize_product_document(raw_doc)
-            if drop_fields:
-                apply_drop_fields(doc, drop_fields)
-            filt = derive_upsert_filter(doc)
-            if not filt:
+
+    def drain(keys: Optional[Set[Tuple[Any, ...]]] = None) -> None:
+        # Wait for in-flight batches writing any of keys (every batch when keys is None)
+        for entry in [entry for entry in pending if keys is None or not keys.isdisjoint(entry[2])]:
+            pending.remove(entry)
+            record_batch(entry[0], entry[1].result())
+
+    def flush_ops() -> None:
+        nonlocal operations, touched_upcs, batch_keys, batches_written
+        if not operations:
+            return
+        batches_written += 1
+        batch, batch_upcs, keys = operations, touched_upcs, batch_keys
+        operations, touched_upcs, batch_keys = [], [], set()
+        if checkpoint_path is not None and position is not None:
+            # Every record read so far is in this batch, an earlier one, or skipped
+            uncheckpointed.append((batches_written, position))
+        if writer is None:
+            record_batch(batches_written, write_batch(batches_written, batch, batch_upcs))
+            return
+        drain(keys)
+        while len(pending) >= write_concurrency:
+            batch_number, future, _ = pending.popleft()
+            record_batch(batch_number, future.result())
+        pending.append((batches_written, writer.submit(write_batch, batches_written, batch, batch_upcs), keys))
+
+    def accept(filt: Dict[str, Any], doc: Dict[str, Any]) -> None:
+        nonlocal processed_docs
+        if last_seen_at is not None:
+            doc["lastSeen"] = last_seen_at
+        operations.append((filt, doc))
+        if best_collection:
+            touched_upcs.extend(doc["details"]["gtin14"])
+        if writer is not None:
+            batch_keys.add(_upsert_filter_key(filt))
+            batch_keys.update(_existing_doc_keys(doc))
+            batch_keys.update(("gtin14", gtin) for gtin in doc["details"]["gtin14"])
+        processed_docs += 1
+        # Periodic progress
+        if progress_every and processed_docs % progress_every == 0:
+            try:
+                print(
+                    json.dumps(
+                        {
+                            "progress": processed_docs,
+                            "upserted_so_far": upserted_total,
+                            "modified_so_far": modified_total,
+                            "skipped_so_far": skipped_total,
+                            "status": "in_progress",
+                        }
+                    ),
+                    flush=True,
+                )
+            except Exception:
+                pass
+
+    def resolve_candidates() -> None:
+        # Avoid overwriting a preferred source with a non-preferred one. Nothing is written
+        # between resolutions of one batch, so every candidate sees the same database
+        # state a per-document find_one would have seen.
+        nonlocal candidates, skipped_total
+        if pending:
+            drain({_upsert_filter_key(filt) for filt, _ in candidates})
+        existing_sources = find_existing_sources(collection, [filt for filt, _ in candidates])
+        for (filt, doc), existing_source in zip(candidates, existing_sources):
+            if existing_source in prefer_sources and doc.get("source") not in prefer_sources:
+                skipped_total += 1
+                continue
+            accept(filt, doc)
+        candidates = []
+
+    try:
+        for file_path, offset, prepared in iter_prepared_records(
+            files, drop_fields, workers, chunk_bytes, start_offsets
+        ):
+            position = (file_path, offset)
+            if prepared is None:
                 skipped_total += 1
                 continue
+            filt, doc = prepared
 
-            # If prefer_sources provided, avoid overwriting a preferred source with a non-preferred one
             if prefer_sources:
-                existing = collection.find_one(filt, projection={"source": 1})
-                if existing and existing.get("source") in prefer_sources and doc.get("source") not in prefer_sources:
-                    skipped_total += 1
+                candidates.append((filt, doc))
+                # Resolve just enough candidates to fill the batch, keeping batch boundaries unchanged
+                if len(operations) + len(candidates) < batch_size:
                     continue
-
-            operations.append(ReplaceOne(filt, doc, upsert=True))
-            processed_docs += 1
+                resolve_candidates()
+            else:
+                accept(filt, doc)
 
             if len(operations) >= batch_size:
-                up, mod = flush_ops()
-                upserted_total += up
-                modified_total += mod
-            # Periodic progress
-            if progress_every and processed_docs % progress_every == 0:
-                try:
-                    print(
-                        json.dumps(
-                            {
-                                "progress": processed_docs,
-                                "upserted_so_far": upserted_total,
-                                "modified_so_far": modified_total,
-                                "skipped_so_far": skipped_total,
-                                "status": "in_progress",
-                            }
-                        ),
-                        flush=True,
-                    )
-                except Exception:
-                    pass
-
-    # Flush remaining operations
-    up, mod = flush_ops()
-    upserted_total += up
-    modified_total += mod
-
-    return processed_docs, upserted_total, modified_total, skipped_total
+                flush_ops()
+
+        # Flush remaining operations
+        if candidates:
+            resolve_candidates()
+        flush_ops()
+        drain()
+        if checkpoint_path is not None and position is not None and not checkpoint_stopped:
+            # Covers skipped records after the last batch, so resuming a finished load reads nothing new
+            write_checkpoint(checkpoint_path, *position)
+    finally:
+        if writer is not None:
+            writer.shutdown(cancel_futures=True)
+
+    return processed_docs, upserted_total, modified_total, skipped_total, failed_total, unchanged_total
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Load product JSONL data into MongoDB with upserts.")
-    parser.add_argument("--data-dir", required=True, help="Directory containing .jsonl/.jsonl.gz files (recursive)")
+    parser.add_argument("--data-dir", help="Directory containing .jsonl/.jsonl.gz files (recursive)")
     parser.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
     parser.add_argument("--collection", default="products", help="Collection name (default: products)")
     parser.add_argument("--batch-size", type=int, default=1000, help="Bulk upsert batch size (default: 1000)")
@@ -299,6 +973,72 @@ def parse_args() -> argparse.Namespace:
         default=os.environ.get("PREFERRED_SOURCES", ""),
         help="Comma-separated list of preferred sources; prefer these when resolving conflicts.",
     )
+    parser.add_argument(
+        "--best-collection",
+        default="",
+        help="Collection holding one pre-ranked best document per UPC; refreshed for UPCs touched by the load. "
+        "Requires --prefer-sources.",
+    )
+    parser.add_argument(
+        "--rebuild-best",
+        action="store_true",
+        help="Fully rebuild --best-collection with an aggregation $merge. Can be used without --data-dir.",
+    )
+    parser.add_argument(
+        "--bloom-snapshot",
+        default="",
+        help="After loading, write a Bloom filter of all UPC/GTIN-14 keys to this file for the API.",
+    )
+    parser.add_argument(
+        "--bloom-fp-rate",
+        type=float,
+        default=0.01,
+        help="Target false-positive rate for --bloom-snapshot (default: 0.01)",
+    )
+    parser.add_argument(
+        "--product-snapshot",
+        default="",
+        help="After loading, write a memory-mappable GTIN-14 -> product snapshot to this file for the API "
+        "(ranked by --prefer-sources).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Parse and normalize input in N worker processes (default: 0 = in the main process)",
+    )
+    parser.add_argument(
+        "--chunk-mb",
+        type=int,
+        default=64,
+        help="With --workers, split uncompressed .jsonl files into chunks of this many MB (default: 64)",
+    )
+    parser.add_argument(
+        "--write-concurrency",
+        type=int,
+        default=1,
+        help="Keep up to N bulk writes in flight while parsing continues (default: 1 = write each batch inline)",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Compare each batch with the stored contentHash values and only rewrite changed documents",
+    )
+    parser.add_argument(
+        "--last-seen",
+        action="store_true",
+        help="Stamp lastSeen on every loaded document; with --skip-unchanged, unchanged documents get only that update",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default="",
+        help="Record the last durably written input position in this JSON manifest after each acknowledged batch",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the position recorded in --checkpoint instead of starting over",
+    )
     parser.add_argument(
         "--progress-every",
         type=int,
@@ -314,13 +1054,33 @@ def main() -> None:
     if not args.uri:
         raise SystemExit("MONGODB_URI not provided. Use --uri or set env var MONGODB_URI.")
 
-    data_dir = Path(args.data_dir)
-    if not data_dir.exists() or not data_dir.is_dir():
-        raise SystemExit(f"Data directory not found or not a directory: {data_dir}")
+    prefer_sources: List[str] = [s.strip() for s in (args.prefer_sources or "").split(",") if s.strip()]
+
+    if args.best_collection and not prefer_sources:
+        raise SystemExit("--best-collection requires --prefer-sources (or env PREFERRED_SOURCES).")
+    if args.rebuild_best and not args.best_collection:
+        raise SystemExit("--rebuild-best requires --best-collection.")
+    if args.resume and not args.checkpoint:
+        raise SystemExit("--resume requires --checkpoint.")
+    if not args.data_dir and not (args.rebuild_best or args.bloom_snapshot or args.product_snapshot):
+        raise SystemExit(
+            "--data-dir is required unless --rebuild-best, --bloom-snapshot or --product-snapshot is given."
+        )
+
+    files: List[Path] = []
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+        if not data_dir.exists() or not data_dir.is_dir():
+            raise SystemExit(f"Data directory not found or not a directory: {data_dir}")
+
+        files = collect_input_files(data_dir)
+        if not files:
+            raise SystemExit(f"No .jsonl or .jsonl.gz files found under {data_dir}")
 
-    files = collect_input_files(data_dir)
-    if not files:
-        raise SystemExit(f"No .jsonl or .jsonl.gz files found under {data_dir}")
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else None
+    start_offsets: Dict[Path, int] = {}
+    if files and checkpoint_path and args.resume:
+        files, start_offsets = read_checkpoint(checkpoint_path, files)
 
     client = get_mongo_client(args.uri)
     db = get_database(client, args.db)
@@ -329,33 +1089,56 @@ def main() -> None:
     # Ensure indexes before loading so lookups work immediately
     ensure_indexes(collection)
 
-    prefer_sources: List[str] = [s.strip() for s in (args.prefer_sources or "").split(",") if s.strip()]
-
-    processed_docs, upserted_total, modified_total, skipped_total = process_files(
-        files,
-        collection,
-        args.batch_size,
-        args.progress_every,
-        args.drop_field,
-        prefer_sources,
-    )
+    summary: Dict[str, Any] = {}
+    if files:
+        processed_docs, upserted_total, modified_total, skipped_total, failed_total, unchanged_total = process_files(
+            files,
+            collection,
+            args.batch_size,
+            args.progress_every,
+            args.drop_field,
+            prefer_sources,
+            # A full rebuild follows, so skip the per-batch refresh
+            best_collection=None if args.rebuild_best else (args.best_collection or None),
+            workers=args.workers,
+            chunk_bytes=max(1, args.chunk_mb) * 1024 * 1024,
+            write_concurrency=args.write_concurrency,
+            skip_unchanged=args.skip_unchanged,
+            last_seen=args.last_seen,
+            start_offsets=start_offsets,
+            checkpoint_path=checkpoint_path,
+        )
 
-    # Ensure indexes again in case collection was new
-    ensure_indexes(collection)
+        # Ensure indexes again in case collection was new
+        ensure_indexes(collection)
 
-    print(
-        json.dumps(
+        summary.update(
             {
                 "processed": processed_docs,
                 "upserted": upserted_total,
                 "modified": modified_total,
                 "skipped": skipped_total,
-                "collection": args.collection,
-                "database": db.name,
-            },
-            ensure_ascii=False,
+                "failed": failed_total,
+                "unchanged": unchanged_total,
+            }
         )
-    )
+        if start_offsets:
+            summary["resumed_from"] = {str(path): offset for path, offset in start_offsets.items()}
+
+    if args.rebuild_best:
+        summary["best_products"] = rebuild_best_products(collection, args.best_collection, prefer_sources)
+
+    if args.bloom_snapshot:
+        summary["bloom_snapshot"] = write_bloom_snapshot(collection, Path(args.bloom_snapshot), args.bloom_fp_rate)
+
+    if args.product_snapshot:
+        summary["product_snapshot"] = write_product_snapshot(collection, Path(args.product_snapshot), prefer_sources)
+
+    summary.update({"collection": args.collection, "database": db.name})
+    if args.best_collection:
+        summary["best_collection"] = args.best_collection
+
+    print(json.dumps(summary, ensure_ascii=False))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+from pymongo import MongoClient, UpdateOne
+
+# Reuse the canonicalization shared by the loader and API so backfilled keys match ingest exactly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog_format import canonical_gtin14_list  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Backfill details.gtin14 from details.upc on existing documents.")
+    p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
+    p.add_argument("--collection", default="products", help="Collection name (default: products)")
+    p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--batch-size", type=int, default=1000, help="Updates per bulk write (default: 1000)")
+    p.add_argument("--dry-run", action="store_true", help="Only count documents missing details.gtin14; do not modify.")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.uri:
+        raise SystemExit("MONGODB_URI not provided. Use --uri or set env var MONGODB_URI.")
+
+    client = MongoClient(args.uri)
+    col = client[args.db][args.collection]
+
+    filter_query = {"details.gtin14": {"$exists": False}}
+    if args.dry_run:
+        print(json.dumps({"matched": col.count_documents(filter_query), "modified": 0, "dry_run": True}))
+        return
+
+    matched = 0
+    modified = 0
+    ops: List[UpdateOne] = []
+    for doc in col.find(filter_query, projection={"details.upc": 1}, batch_size=args.batch_size):
+        matched += 1
+        upcs = (doc.get("details") or {}).get("upc") or []
+        if isinstance(upcs, str):
+            upcs = [upcs]
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"details.gtin14": canonical_gtin14_list([str(u) for u in upcs])}}))
+        if len(ops) >= args.batch_size:
+            modified += col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        modified += col.bulk_write(ops, ordered=False).modified_count
+
+    col.create_index("details.gtin14", name="idx_details_gtin14")
+    print(json.dumps({"matched": matched, "modified": modified, "dry_run": False}))
+
+
+if __name__ == "__main__":
+    main()
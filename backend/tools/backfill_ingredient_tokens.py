@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+from pymongo import MongoClient, UpdateOne
+
+# Reuse the tokenizer shared by the loader and API so backfilled tokens match ingest exactly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog_format import ingredient_tokens  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Backfill details.ingredientTokens from details.ingredients.")
+    p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
+    p.add_argument("--collection", default="products", help="Collection name (default: products)")
+    p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--batch-size", type=int, default=1000, help="Updates per bulk write (default: 1000)")
+    p.add_argument("--all", action="store_true", help="Recompute tokens on every document, not only missing ones")
+    p.add_argument("--dry-run", action="store_true", help="Only count documents to update; do not modify.")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.uri:
+        raise SystemExit("MONGODB_URI not provided. Use --uri or set env var MONGODB_URI.")
+
+    client = MongoClient(args.uri)
+    col = client[args.db][args.collection]
+
+    filter_query = {} if args.all else {"details.ingredientTokens": {"$exists": False}}
+    if args.dry_run:
+        print(json.dumps({"matched": col.count_documents(filter_query), "modified": 0, "dry_run": True}))
+        return
+
+    matched = 0
+    modified = 0
+    ops: List[UpdateOne] = []
+    for doc in col.find(filter_query, projection={"details.ingredients": 1}, batch_size=args.batch_size):
+        matched += 1
+        ingredients = (doc.get("details") or {}).get("ingredients") or []
+        if isinstance(ingredients, str):
+            ingredients = [ingredients]
+        tokens = ingredient_tokens([str(i) for i in ingredients if i is not None])
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"details.ingredientTokens": tokens}}))
+        if len(ops) >= args.batch_size:
+            modified += col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        modified += col.bulk_write(ops, ordered=False).modified_count
+
+    col.create_index([("details.ingredientTokens", 1), ("_id", 1)], name="idx_ingredient_tokens_id")
+    print(json.dumps({"matched": matched, "modified": modified, "dry_run": False}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import List
+
+from pymongo import MongoClient, UpdateOne
+
+# Reuse the format shared by the loader and API so backfilled values compare like newly loaded ones
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog_format import canonical_scraped_at  # noqa: E402
+
+CANONICAL_SCRAPED_AT = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Rewrite string scrapedAt values to the loader's canonical UTC format.")
+    p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
+    p.add_argument("--collection", default="products", help="Collection name (default: products)")
+    p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--batch-size", type=int, default=1000, help="Updates per bulk write (default: 1000)")
+    p.add_argument("--dry-run", action="store_true", help="Only count non-canonical scrapedAt strings; do not modify.")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.uri:
+        raise SystemExit("MONGODB_URI not provided. Use --uri or set env var MONGODB_URI.")
+
+    client = MongoClient(args.uri)
+    col = client[args.db][args.collection]
+
+    filter_query = {"scrapedAt": {"$type": "string", "$not": CANONICAL_SCRAPED_AT}}
+    if args.dry_run:
+        print(json.dumps({"matched": col.count_documents(filter_query), "modified": 0, "dry_run": True}))
+        return
+
+    matched = 0
+    modified = 0
+    unparseable = 0
+    ops: List[UpdateOne] = []
+    for doc in col.find(filter_query, projection={"scrapedAt": 1}, batch_size=args.batch_size):
+        matched += 1
+        scraped_at = canonical_scraped_at(doc["scrapedAt"])
+        if scraped_at is None:
+            unparseable += 1
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"scrapedAt": scraped_at}}))
+        if len(ops) >= args.batch_size:
+            modified += col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        modified += col.bulk_write(ops, ordered=False).modified_count
+
+    print(json.dumps({"matched": matched, "modified": modified, "unparseable": unparseable, "dry_run": False}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from pymongo import MongoClient
+
+# Benchmark the API's own encoder and the loader's normalization
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app import brotli, cbor2, compress_body, dumps_json, encode_body, msgpack, orjson, shape_product  # noqa: E402
+from load_data import collect_input_files, iter_jsonl_records, normalize_product_document  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Compare response serialization cost on real product documents.")
+    p.add_argument("--data-dir", default=None, help="Read documents from .jsonl/.jsonl.gz files instead of MongoDB")
+    p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
+    p.add_argument("--collection", default="products", help="Collection name (default: products)")
+    p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--sample", type=int, default=1000, help="Number of documents to benchmark (default: 1000)")
+    p.add_argument("--rounds", type=int, default=5, help="Timed passes over the sample; best pass is reported (default: 5)")
+    return p.parse_args()
+
+
+def load_documents(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    docs: List[Dict[str, Any]] = []
+    if args.data_dir:
+        for path in collect_input_files(Path(args.data_dir)):
+            for raw in iter_jsonl_records(path):
+                docs.append(normalize_product_document(raw))
+                if len(docs) >= args.sample:
+                    return docs
+        return docs
+
+    if not args.uri:
+        raise SystemExit("MONGODB_URI not provided. Use --uri, set env var MONGODB_URI, or pass --data-dir.")
+    col = MongoClient(args.uri)[args.db][args.collection]
+    return list(col.aggregate([{"$sample": {"size": args.sample}}, {"$project": {"_id": 0}}]))
+
+
+def fastapi_default(doc: Dict[str, Any]) -> bytes:
+    # What returning a dict did before: jsonable_encoder, then JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(doc), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def time_encoder(encode: Callable[[Any], bytes], items: List[Any], rounds: int) -> Dict[str, Any]:
+    best = float("inf")
+    total_bytes = 0
+    for _ in range(rounds):
+        total_bytes = 0
+        start = time.perf_counter()
+        for item in items:
+            total_bytes += len(encode(item))
+        best = min(best, time.perf_counter() - start)
+    return {
+        "us_per_doc": round(best / len(items) * 1e6, 2),
+        "docs_per_sec": round(len(items) / best) if best else None,
+        "avg_bytes": round(total_bytes / len(items)),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    docs = load_documents(args)
+    if not docs:
+        raise SystemExit("No documents to benchmark.")
+
+    # Hot path: the UPC cache holds each product's body already serialized
+    cached = [dumps_json(doc) for doc in docs]
+
+    results = {
+        "fastapi_default": time_encoder(fastapi_default, docs, args.rounds),
+        "fast_encoder": time_encoder(dumps_json, docs, args.rounds),
+        "cached_bytes": time_encoder(cached.__getitem__, list(range(len(docs))), args.rounds),
+    }
+
+    # Negotiated representations as served, including the COMPRESSION_MIN_BYTES threshold
+    formats = ["json"] + [name for name, mod in (("msgpack", msgpack), ("cbor", cbor2)) if mod is not None]
+    codings = [None, "gzip"] + (["br"] if brotli is not None else [])
+    encodings = {}
+    for fmt in formats:
+        for coding in codings:
+            label = fmt if coding is None else f"{fmt}+{coding}"
+            encode = lambda doc, fmt=fmt, coding=coding: compress_body(  # noqa: E731
+                encode_body(shape_product(doc, fmt), fmt), coding
+            )[0]
+            encodings[label] = time_encoder(encode, docs, args.rounds)
+    print(
+        json.dumps(
+            {
+                "documents": len(docs),
+                "rounds": args.rounds,
+                "encoder": "orjson" if orjson is not None else "json",
+                "results": results,
+                "encodings": encodings,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# Fields the loader writes for its own use; no product response may carry them
+INTERNAL_FIELDS = ("contentHash", "lastSeen")
+INTERNAL_DETAILS_FIELDS = ("gtin14", "ingredientTokens")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Verify that batch UPC responses are the same on a cold and a warm product cache."
+    )
+    p.add_argument("--base-url", default="http://127.0.0.1:8000", help="API base URL")
+    p.add_argument("--upc-file", default="bench_upcs.json", help="UPC list written by 'load_test.py seed'")
+    p.add_argument("--batch-size", type=int, default=50, help="UPCs per batch request (default: 50)")
+    p.add_argument(
+        "--fields", action="append", default=None, help="Fieldsets to check (repeatable; default: full and summary)"
+    )
+    p.add_argument(
+        "--admin-token", default=os.environ.get("ADMIN_TOKEN"), help="Admin token (default: env ADMIN_TOKEN)"
+    )
+    return p.parse_args()
+
+
+def document_keys(doc: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Top-level and details.* keys of a product, or None for a miss."""
+    if doc is None:
+        return None
+    keys = sorted(doc)
+    details = doc.get("details")
+    if isinstance(details, dict):
+        keys.extend(sorted("details." + k for k in details))
+    return keys
+
+
+def internal_keys(doc: Optional[Dict[str, Any]]) -> List[str]:
+    if doc is None:
+        return []
+    found = [k for k in INTERNAL_FIELDS if k in doc]
+    details = doc.get("details")
+    if isinstance(details, dict):
+        found.extend("details." + k for k in INTERNAL_DETAILS_FIELDS if k in details)
+    return found
+
+
+def fetch_batch(args: argparse.Namespace, upcs: List[str], fields: Optional[str]) -> Dict[str, Any]:
+    resp = requests.post(f"{args.base_url}/api/products/upc/batch", json={"upcs": upcs, "fields": fields}, timeout=30)
+    resp.raise_for_status()
+    return resp.json()["results"]
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.admin_token:
+        raise SystemExit("ADMIN_TOKEN not provided. Use --admin-token or set env var ADMIN_TOKEN.")
+    with open(args.upc_file, encoding="utf-8") as f:
+        upcs: List[str] = json.load(f)["upcs"]
+
+    mismatches: List[Dict[str, Any]] = []
+    checked = 0
+    for fields in args.fields or [None, "summary"]:
+        for start in range(0, len(upcs), args.batch_size):
+            batch = upcs[start:start + args.batch_size]
+            # Every UPC is looked up in MongoDB first, then served from the cache
+            requests.post(
+                f"{args.base_url}/admin/cache/invalidate", headers={"X-Admin-Token": args.admin_token}, timeout=30
+            ).raise_for_status()
+            cold = fetch_batch(args, batch, fields)
+            warm = fetch_batch(args, batch, fields)
+            for upc in batch:
+                checked += 1
+                cold_keys, warm_keys = document_keys(cold.get(upc)), document_keys(warm.get(upc))
+                leaked = internal_keys(cold.get(upc)) + internal_keys(warm.get(upc))
+                if cold_keys != warm_keys or leaked:
+                    mismatches.append(
+                        {"upc": upc, "fields": fields, "cold": cold_keys, "warm": warm_keys, "internal": leaked}
+                    )
+
+    print(json.dumps({"checked": checked, "mismatches": len(mismatches), "examples": mismatches[:10]}))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
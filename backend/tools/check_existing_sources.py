@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+from pymongo import MongoClient
+
+# Check the loader's batched precedence lookup against the per-document find_one it replaced
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from load_data import derive_upsert_filter, find_existing_sources  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Verify that the loader's batched source lookup matches a find_one per upsert filter."
+    )
+    p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
+    p.add_argument("--collection", default="products", help="Collection name (default: products)")
+    p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--sample", type=int, default=10000, help="Stored documents to derive filters from (default: 10000)")
+    p.add_argument("--batch-size", type=int, default=1000, help="Filters per batched lookup (default: 1000)")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.uri:
+        raise SystemExit("MONGODB_URI not provided. Use --uri or set env var MONGODB_URI.")
+
+    client = MongoClient(args.uri)
+    col = client[args.db][args.collection]
+
+    # Stored documents are already normalized, so they derive the same filters the loader would
+    filters: List[Dict[str, Any]] = []
+    for doc in col.aggregate([{"$sample": {"size": args.sample}}]):
+        filt = derive_upsert_filter(doc)
+        if filt:
+            filters.append(filt)
+
+    mismatches: List[Dict[str, Any]] = []
+    for start in range(0, len(filters), args.batch_size):
+        batch = filters[start:start + args.batch_size]
+        batched = find_existing_sources(col, batch)
+        for filt, source in zip(batch, batched):
+            existing = col.find_one(filt, projection={"source": 1})
+            expected = existing.get("source") if existing else None
+            if source != expected:
+                mismatches.append({"filter": filt, "batched": source, "find_one": expected})
+
+    print(json.dumps({"checked": len(filters), "mismatches": len(mismatches), "examples": mismatches[:10]}, default=str))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
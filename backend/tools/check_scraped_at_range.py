@@ -0,0 +1,97 @@
+import argparse
+import base64
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+import requests
+from bson import ObjectId
+from pymongo import MongoClient
+
+# Expected matches use the same parsing as the API, applied in Python instead of MongoDB
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog_format import canonical_scraped_at, parse_timestamp  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Verify that export scraped_after/scraped_before filters match the stored scrapedAt instants."
+    )
+    p.add_argument("--base-url", default="http://127.0.0.1:8000", help="API base URL")
+    p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
+    p.add_argument("--collection", default="products", help="Collection name (default: products)")
+    p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--source", required=True, help="Source to check (limits the scan and the export)")
+    p.add_argument("--after", default=None, help="scraped_after bound (inclusive), any ISO-8601 form")
+    p.add_argument("--before", default=None, help="scraped_before bound (exclusive), any ISO-8601 form")
+    return p.parse_args()
+
+
+def in_range(value: Any, after: Optional[str], before: Optional[str]) -> bool:
+    """Whether a stored scrapedAt falls in [after, before); strings have whole-second precision, dates do not."""
+    if isinstance(value, datetime):
+        instant = parse_timestamp(value)
+        low = parse_timestamp(after) if after else None
+        high = parse_timestamp(before) if before else None
+    elif isinstance(value, str) and parse_timestamp(value) is not None:
+        instant = parse_timestamp(canonical_scraped_at(value))
+        low = parse_timestamp(canonical_scraped_at(after)) if after else None
+        high = parse_timestamp(canonical_scraped_at(before)) if before else None
+    else:
+        return False
+    return (low is None or instant >= low) and (high is None or instant < high)
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.uri:
+        raise SystemExit("MONGODB_URI not provided. Use --uri or set env var MONGODB_URI.")
+    if not args.after and not args.before:
+        raise SystemExit("Give --after and/or --before.")
+
+    col = MongoClient(args.uri)[args.db][args.collection]
+    expected: Set[ObjectId] = set()
+    non_canonical = 0
+    for doc in col.find({"source": args.source}, projection={"scrapedAt": 1}, batch_size=10000):
+        value = doc.get("scrapedAt")
+        if isinstance(value, str) and canonical_scraped_at(value) not in (None, value):
+            non_canonical += 1
+        if in_range(value, args.after, args.before):
+            expected.add(doc["_id"])
+
+    params: Dict[str, str] = {"source": args.source, "fields": "scrapedAt"}
+    if args.after:
+        params["scraped_after"] = args.after
+    if args.before:
+        params["scraped_before"] = args.before
+    exported: Set[ObjectId] = set()
+    with requests.get(f"{args.base_url}/api/products/export", params=params, stream=True, timeout=300) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line:
+                exported.add(ObjectId(base64.urlsafe_b64decode(json.loads(line)["_cursor"])))
+
+    extra = [str(i) for i in exported - expected]
+    dropped = [str(i) for i in expected - exported]
+    print(
+        json.dumps(
+            {
+                "expected": len(expected),
+                "exported": len(exported),
+                "extra": len(extra),
+                "dropped": len(dropped),
+                # Stored strings in other formats compare out of order; run tools/backfill_scraped_at.py
+                "non_canonical": non_canonical,
+                "examples": {"extra": extra[:10], "dropped": dropped[:10]},
+            }
+        )
+    )
+    if extra or dropped:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
 import argparse
+import json
 import os
 from pymongo import MongoClient
 
+# Same names the API verifies at startup (app.REQUIRED_INDEXES)
+REQUIRED_INDEXES = (
+    "idx_details_upc",
+    "idx_details_gtin14",
+    "idx_product_text",
+    "idx_ingredient_tokens_id",
+    "idx_source_articleNumber",
+)
+
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Ensure required indexes exist on products collection.")
     p.add_argument("--db", default="wellaware", help="Database name (default: wellaware)")
     p.add_argument("--collection", default="products", help="Collection name (default: products)")
     p.add_argument("--uri", default=os.environ.get("MONGODB_URI"), help="MongoDB URI (default: env MONGODB_URI)")
+    p.add_argument("--check", action="store_true", help="Only report missing indexes; exit 1 if any are missing")
     return p.parse_args()
 
 
@@ -19,7 +30,24 @@ def main() -> None:
     client = MongoClient(args.uri)
     col = client[args.db][args.collection]
 
+    if args.check:
+        existing = set(col.index_information())
+        missing = [name for name in REQUIRED_INDEXES if name not in existing]
+        print(json.dumps({"missing_indexes": missing}))
+        raise SystemExit(1 if missing else 0)
+
     col.create_index("details.upc", name="idx_details_upc")
+    col.create_index("details.gtin14", name="idx_details_gtin14")
+    col.create_index(
+        [("productName", "text"), ("brand", "text"), ("category", "text")],
+        weights={"productName": 10, "brand": 5, "category": 2},
+        default_language="none",
+        name="idx_product_text",
+    )
+    col.create_index([("details.ingredientTokens", 1), ("_id", 1)], name="idx_ingredient_tokens_id")
+    # Superseded by idx_ingredient_tokens_id, which has it as a prefix
+    if "idx_ingredient_tokens" in col.index_information():
+        col.drop_index("idx_ingredient_tokens")
     col.create_index([("source", 1), ("details.articleNumber", 1)], name="idx_source_articleNumber")
     print("indexes_ensured=true")
 
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+from pymongo import MongoClient, ReplaceOne
+
+# Seed with the loader's own normalization so documents match the canonical schema
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog_format import gtin_check_digit  # noqa: E402
+from load_data import (  # noqa: E402
+    compute_content_hash,
+    derive_upsert_filter,
+    ensure_indexes,
+    normalize_product_document,
+)
+
+SOURCES = ["Open Food Facts API", "Open Beauty API", "loblaws", "sobeys", "safeway"]
+CATEGORIES = ["dairy", "bakery", "snacks", "beverages", "frozen", "produce", "personal care"]
+WORDS = ["organic", "oat", "milk", "chocolate", "crispy", "whole", "grain", "vanilla", "sea", "salt", "honey", "almond"]
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Seed a synthetic catalog and load-test the WellAware API.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    seed = sub.add_parser("seed", help="Write a synthetic catalog to a local MongoDB")
+    seed.add_argument("--uri", default="mongodb://localhost:27017", help="MongoDB URI (default: local mongod)")
+    seed.add_argument("--db", default="wellaware_bench", help="Database name (default: wellaware_bench)")
+    seed.add_argument("--collection", default="products", help="Collection name (default: products)")
+    seed.add_argument("--products", type=int, default=100000, help="Distinct UPCs to generate (default: 100000)")
+    seed.add_argument(
+        "--contested-ratio",
+        type=float,
+        default=0.3,
+        help="Share of UPCs also listed by 1-2 other sources, exercising preferred-source ranking (default: 0.3)",
+    )
+    seed.add_argument("--upc-file", default="bench_upcs.json", help="Where to write the seeded UPC list")
+    seed.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+
+    run = sub.add_parser("run", help="Drive concurrent UPC workloads against a running API")
+    run.add_argument("--base-url", default="http://127.0.0.1:8000", help="API base URL")
+    run.add_argument("--upc-file", default="bench_upcs.json", help="UPC list written by 'seed'")
+    run.add_argument("--concurrency", type=int, default=32, help="Concurrent clients (default: 32)")
+    run.add_argument("--duration", type=float, default=30.0, help="Seconds to run (default: 30)")
+    run.add_argument("--warmup", type=float, default=3.0, help="Seconds of unrecorded warmup (default: 3)")
+    run.add_argument("--hit-weight", type=float, default=0.6, help="Weight of single lookups for known UPCs")
+    run.add_argument("--contested-weight", type=float, default=0.2, help="Weight of lookups for multi-source UPCs")
+    run.add_argument("--miss-weight", type=float, default=0.15, help="Weight of lookups for unknown UPCs")
+    run.add_argument("--batch-weight", type=float, default=0.05, help="Weight of batch lookups")
+    run.add_argument("--batch-size", type=int, default=50, help="UPCs per batch request (default: 50)")
+    run.add_argument("--hot-set", type=int, default=2000, help="Size of the popular-UPC set (default: 2000)")
+    run.add_argument("--hot-share", type=float, default=0.8, help="Share of hits drawn from the hot set (default: 0.8)")
+    run.add_argument("--mongo-uri", default=os.environ.get("MONGODB_URI"), help="Read serverStatus opcounters from here")
+    run.add_argument("--output", default=None, help="Write results JSON here (default: bench_<commit>_<time>.json)")
+    run.add_argument("--seed", type=int, default=7, help="Random seed (default: 7)")
+    return p.parse_args()
+
+
+def make_upc(rng: random.Random) -> str:
+    body = "".join(str(rng.randint(0, 9)) for _ in range(11))
+    return body + str(gtin_check_digit(body))
+
+
+def synthetic_product(rng: random.Random, upc: str, source: str, scraped_at: datetime) -> Dict[str, Any]:
+    name = " ".join(rng.sample(WORDS, 3)).title()
+    return {
+        "productName": name,
+        "brand": rng.choice(["Acme", "Maple Farms", "Nordic", "Sunrise", "Blue Lake"]),
+        "source": source,
+        "productUrl": f"https://example.com/{source.replace(' ', '-').lower()}/{upc}",
+        "imageUrl": f"https://img.example.com/{upc}.jpg",
+        "category": rng.sample(CATEGORIES, 2),
+        "scrapedAt": scraped_at.isoformat(),
+        "details": {
+            "upc": [upc],
+            "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+            "size": f"{rng.randint(100, 2000)} g",
+            "ingredients": [rng.choice(WORDS) for _ in range(rng.randint(3, 15))],
+            "nutritionFacts": {
+                n: {"value": round(rng.uniform(0, 50), 1), "unit": "g"}
+                for n in ["fat", "saturated fat", "carbohydrate", "sugars", "fibre", "protein", "sodium"]
+            },
+        },
+    }
+
+
+def seed_catalog(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    col = MongoClient(args.uri)[args.db][args.collection]
+    col.drop()
+    ensure_indexes(col)
+
+    now = datetime.now(timezone.utc)
+    upcs: List[str] = []
+    contested: List[str] = []
+    ops: List[ReplaceOne] = []
+    for _ in range(args.products):
+        upc = make_upc(rng)
+        upcs.append(upc)
+        sources = [rng.choice(SOURCES)]
+        if rng.random() < args.contested_ratio:
+            sources = rng.sample(SOURCES, rng.randint(2, 3))
+            contested.append(upc)
+        for source in sources:
+            doc = normalize_product_document(
+                synthetic_product(rng, upc, source, now - timedelta(days=rng.randint(0, 30)))
+            )
+            doc["contentHash"] = compute_content_hash(doc)
+            ops.append(ReplaceOne({"source": source, **derive_upsert_filter(doc)}, doc, upsert=True))
+        if len(ops) >= 1000:
+            col.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        col.bulk_write(ops, ordered=False)
+
+    with open(args.upc_file, "w", encoding="utf-8") as f:
+        json.dump({"upcs": upcs, "contested": contested}, f)
+    print(json.dumps({"seeded_upcs": len(upcs), "contested": len(contested), "documents": col.count_documents({})}))
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[idx] * 1000, 2)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "p50_ms": percentile(ordered, 50),
+        "p95_ms": percentile(ordered, 95),
+        "p99_ms": percentile(ordered, 99),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else None,
+    }
+
+
+def mongo_opcounters(uri: Optional[str]) -> Optional[Dict[str, int]]:
+    if not uri:
+        return None
+    try:
+        status = MongoClient(uri, serverSelectionTimeoutMS=5000).admin.command("serverStatus")
+    except Exception:
+        return None
+    return {k: int(v) for k, v in status.get("opcounters", {}).items()}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def run_workload(args: argparse.Namespace) -> None:
+    with open(args.upc_file, encoding="utf-8") as f:
+        catalog = json.load(f)
+    upcs: List[str] = catalog["upcs"]
+    contested: List[str] = catalog["contested"] or upcs
+    hot = upcs[: args.hot_set]
+
+    ops = ["hit", "contested", "miss", "batch"]
+    weights = [args.hit_weight, args.contested_weight, args.miss_weight, args.batch_weight]
+
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = {op: [] for op in ops}
+    errors: Dict[str, int] = {op: 0 for op in ops}
+    start_at = time.monotonic()
+    record_from = start_at + args.warmup
+    stop_at = record_from + args.duration
+
+    def client(worker: int) -> None:
+        rng = random.Random(args.seed * 1000 + worker)
+        session = requests.Session()
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            op = rng.choices(ops, weights)[0]
+            try:
+                if op == "batch":
+                    payload = {"upcs": rng.sample(upcs, min(args.batch_size, len(upcs)))}
+                    t0 = time.perf_counter()
+                    resp = session.post(f"{args.base_url}/api/products/upc/batch", json=payload, timeout=30)
+                    ok = resp.status_code == 200
+                else:
+                    if op == "hit":
+                        upc = rng.choice(hot) if rng.random() < args.hot_share else rng.choice(upcs)
+                    elif op == "contested":
+                        upc = rng.choice(contested)
+                    else:
+                        upc = make_upc(rng)
+                    t0 = time.perf_counter()
+                    resp = session.get(f"{args.base_url}/api/products/upc/{upc}", timeout=30)
+                    ok = resp.status_code in (200, 404)
+            except requests.RequestException:
+                # Timeouts and dropped connections under load are errors, not the end of the run
+                ok = False
+            elapsed = time.perf_counter() - t0
+            if now < record_from:
+                continue
+            with lock:
+                if ok:
+                    latencies[op].append(elapsed)
+                else:
+                    errors[op] += 1
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    before = mongo_opcounters(args.mongo_uri)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(client, i) for i in range(args.concurrency)]:
+            future.result()
+    after = mongo_opcounters(args.mongo_uri)
+
+    all_latencies = [v for op in ops for v in latencies[op]]
+    result: Dict[str, Any] = {
+        "commit": git_commit(),
+        "started_at": started_at,
+        "config": {k: v for k, v in vars(args).items() if k not in ("command", "mongo_uri")},
+        "overall": summarize(all_latencies, sum(errors.values()), args.duration),
+        "by_operation": {op: summarize(latencies[op], errors[op], args.duration) for op in ops},
+        "mongo_ops": {k: after[k] - before.get(k, 0) for k in after} if before and after else None,
+    }
+
+    output = args.output or f"bench_{result['commit'] or 'nocommit'}_{int(time.time())}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps({"output": output, "overall": result["overall"], "mongo_ops": result["mongo_ops"]}))
+
+
+def main() -> None:
+    args = parse_args()
+    if args.command == "seed":
+        seed_catalog(args)
+    else:
+        run_workload(args)
+
+
+if __name__ == "__main__":
+    main()